@@ -0,0 +1,85 @@
+import io
+import unittest
+from datetime import datetime, timedelta
+
+from botocore.awsrequest import AWSResponse
+from botocore.response import StreamingBody
+
+from twmap.world.world_loader import WorldLoader
+
+SNAPSHOT_BUCKET = "tribalwars-scraped"
+IMAGE_BUCKET = "tw-timelapse"
+
+
+class InMemoryS3:
+    """Answers the S3 calls of a boto3 client from in-memory buckets, without network access.
+
+    Like botocore.stub.Stubber the calls are intercepted before they are sent, but the responses
+    are computed from the call (Prefix, StartAfter, uploaded bodies) instead of queued in order.
+    """
+
+    def __init__(self, client, buckets):
+        self.objects = {bucket: {} for bucket in buckets}
+        events = client.meta.events
+        events.register_first("before-parameter-build.s3.*", self._record_params, unique_id="in-memory-s3-params")
+        events.register_first("before-call.s3.*", self._respond, unique_id="in-memory-s3-call")
+
+    @staticmethod
+    def _record_params(params, context, **kwargs):
+        context["in_memory_s3_params"] = dict(params)
+
+    def _respond(self, model, context, **kwargs):
+        params = context["in_memory_s3_params"]
+        objects = self.objects[params["Bucket"]]
+        if model.name == "ListObjectsV2":
+            keys = sorted(key for key in objects if key.startswith(params.get("Prefix", "")) and key > params.get("StartAfter", ""))
+            return AWSResponse(None, 200, {}, None), {"Contents": [{"Key": key} for key in keys], "IsTruncated": False, "KeyCount": len(keys)}
+        if model.name == "GetObject":
+            if params["Key"] not in objects:
+                return AWSResponse(None, 404, {}, None), {"Error": {"Code": "NoSuchKey", "Message": params["Key"]}}
+            body = objects[params["Key"]]
+            return AWSResponse(None, 200, {}, None), {"Body": StreamingBody(io.BytesIO(body), len(body))}
+        if model.name == "PutObject":
+            body = params.get("Body", b"")
+            objects[params["Key"]] = body.encode() if isinstance(body, str) else bytes(body)
+            return AWSResponse(None, 200, {}, None), {}
+        raise NotImplementedError(model.name)
+
+    def put(self, bucket: str, key: str, body: bytes = b"") -> None:
+        self.objects[bucket][key] = body
+
+
+class IncrementalScanTest(unittest.TestCase):
+    """Incremental snapshot scans must find the same files as a full rescan."""
+
+    def setUp(self):
+        self.loader = WorldLoader(world="146", server="en", s3_image_bucket=IMAGE_BUCKET, s3_snapshot_bucket=SNAPSHOT_BUCKET, init_load=False)
+        self.s3 = InMemoryS3(self.loader.s3_client, [SNAPSHOT_BUCKET, IMAGE_BUCKET])
+        self.timestamps = [
+            (datetime(2025, 9, 20, 0, 14, 58) + timedelta(hours=6 * i)).strftime("%Y%m%d_%H%M%S") for i in range(6)
+        ]
+        for timestamp in self.timestamps:
+            for name in ("village", "player", "ally"):
+                self.s3.put(SNAPSHOT_BUCKET, f"en146/{name}_en146_{timestamp}.txt")
+        self.s3.put(SNAPSHOT_BUCKET, "en146/conquer.txt")
+
+    def put_columnar(self, index: int) -> None:
+        self.s3.put(SNAPSHOT_BUCKET, f"en146/columnar/snapshot_en146_{self.timestamps[index]}.npz")
+
+    def test_columnar_file_written_out_of_order(self):
+        # Snapshot 2 failed to convert on the first run and is converted later
+        for index in (0, 1, 3, 4, 5):
+            self.put_columnar(index)
+        self.assertEqual(len(self.loader.scan_available_snapshots(full_rescan=True)), 6)
+        self.put_columnar(2)
+
+        incremental = self.loader.scan_available_snapshots()
+        self.assertTrue(all(snapshot.columnar_data_path for snapshot in incremental))
+        self.assertEqual(
+            [snapshot.model_dump() for snapshot in incremental],
+            [snapshot.model_dump() for snapshot in self.loader.scan_available_snapshots(full_rescan=True)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from twmap.world import world_loader
 from twmap.world.world_loader import WorldLoader
 from twmap.mapfactory import MapFactory
+from twmap.snapshot.snapshot_cache import SnapshotCache
+from twmap.snapshot.dataloader import DataLoader
+from twmap.snapshot.ownership_history import OwnershipHistory
+from twmap.snapshot.entity_history import WorldTimeSeries
 
 # Set up logging
 logging.basicConfig(
@@ -20,7 +24,8 @@ logging.basicConfig(
     ]
 )
 
-def generate_maps_for_world(world: str, server: str = "en", max_coords: int = 750, max_workers: int = 4, limit_images: int = None, interval: int = 1, regenerate_all: bool = False):
+def generate_maps_for_world(world: str, server: str = "en", max_coords: int = 750, max_workers: int = 4, limit_images: int = None, interval: int = 1, regenerate_all: bool = False, execution_mode: str = "thread", cache_dir: str = None, offline: bool = False,
+                            memory_budget_mb: int = None):
     """Generate missing maps for a specific world
     
     Args:
@@ -30,6 +35,12 @@ def generate_maps_for_world(world: str, server: str = "en", max_coords: int = 75
         max_workers: Number of parallel workers
         limit_images: Limit number of images to process (for testing)
         interval: Generate every Nth image (1=all, 2=every 2nd, 3=every 3rd, etc.)
+        regenerate_all: Regenerate all maps, overwriting existing ones
+        execution_mode: "thread" or "process" pool for rendering, processes avoid GIL contention,
+                        or "pipeline" to overlap downloads with rendering in separate stages
+        cache_dir: Directory of the local snapshot cache, None disables caching unless offline is set
+        offline: Serve snapshot files only from the local cache
+        memory_budget_mb: RSS budget in MiB for concurrent rendering, None runs max_workers jobs at a time
     """
     
     logging.info(f"Processing world {server}{world} with interval {interval}")
@@ -60,11 +71,65 @@ def generate_maps_for_world(world: str, server: str = "en", max_coords: int = 75
         logging.info(f"Limited processing to first {limit_images} images for testing")
 
     # Create MapFactory and generate missing maps
-    map_factory = MapFactory(world_loader, max_coords=max_coords)
-    map_factory.generate_missing_maps(max_workers=max_workers, regenerate_all=regenerate_all, interval=interval)
+    snapshot_cache = SnapshotCache(cache_dir, offline=offline) if cache_dir or offline else None
+    map_factory = MapFactory(world_loader, max_coords=max_coords, snapshot_cache=snapshot_cache)
+    try:
+        map_factory.generate_missing_maps(max_workers=max_workers, regenerate_all=regenerate_all, interval=interval, execution_mode=execution_mode,
+                                          memory_budget_mb=memory_budget_mb)
+    finally:
+        map_factory.close()
     
     logging.info(f"Completed processing world {server}{world}")
 
+def convert_snapshots_for_world(world: str, server: str = "en", overwrite: bool = False):
+    """Write the columnar snapshot files of a world next to its raw .txt dumps
+
+    Args:
+        world: World number (e.g., "143")
+        server: Server name (e.g., "en")
+        overwrite: Rewrite snapshots that were already converted
+    """
+
+    logging.info(f"Converting snapshots of world {server}{world} to columnar format")
+
+    world_loader = WorldLoader(world=world, server=server)
+    with DataLoader(world_loader) as data_loader:
+        data_loader.convert_all_snapshots(overwrite=overwrite)
+
+def build_ownership_history_for_world(world: str, server: str = "en", history_dir: str = None):
+    """Build or extend the memory-mapped village ownership history of a world
+
+    Args:
+        world: World number (e.g., "143")
+        server: Server name (e.g., "en")
+        history_dir: Root directory of the histories, defaults to $TWMAP_HISTORY_DIR or ~/.cache/twmap/history
+    """
+
+    logging.info(f"Updating the ownership history of world {server}{world}")
+
+    world_loader = WorldLoader(world=world, server=server)
+    history = OwnershipHistory.for_world(server, world, history_dir)
+    with DataLoader(world_loader) as data_loader:
+        history.update(data_loader)
+    return history
+
+def build_time_series_for_world(world: str, server: str = "en", history_dir: str = None):
+    """Build or extend the player and tribe time series of a world
+
+    Args:
+        world: World number (e.g., "143")
+        server: Server name (e.g., "en")
+        history_dir: Root directory of the histories, defaults to $TWMAP_HISTORY_DIR or ~/.cache/twmap/history
+    """
+
+    logging.info(f"Updating the player and tribe time series of world {server}{world}")
+
+    world_loader = WorldLoader(world=world, server=server)
+    time_series = WorldTimeSeries.for_world(server, world, history_dir)
+    with DataLoader(world_loader) as data_loader:
+        time_series.update(data_loader)
+    return time_series
+
 def main():
     """Generate all missing maps for all worlds"""
     
@@ -86,6 +151,7 @@ def main():
                 max_workers=8, 
                 interval=interval,
                 regenerate_all=True,  # Regenerate all maps,
+                execution_mode="process",  # Render in worker processes to use all cores
             )
         except Exception as e:
             logging.error(f"Error processing world {world}: {e}")
@@ -0,0 +1,45 @@
+import os
+import threading
+
+from PIL import ImageFont
+
+# Fonts ship next to this module, so they are found regardless of the working directory
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+DEFAULT_FONT = "Roboto_Condensed-Bold.ttf"
+
+# (font file, size) -> FreeTypeFont, shared by every Map and thread of the process.
+# A map uses a few dozen sizes (labels scale with village counts), so the cache is not bounded.
+_fonts = {}
+_fonts_lock = threading.Lock()
+
+
+def font_path(name: str = DEFAULT_FONT) -> str:
+    """Absolute path of a font file in twmap/map/fonts."""
+    return os.path.join(FONT_DIR, name)
+
+
+def get_font(size: int, name: str = DEFAULT_FONT) -> ImageFont.FreeTypeFont:
+    """Get a font face of the given size, loading the font file only once per size.
+
+    Args:
+        size (int): Font size.
+        name (str, optional): Font file in twmap/map/fonts. Defaults to DEFAULT_FONT.
+
+    Returns:
+        ImageFont.FreeTypeFont: The shared font face. Do not modify it.
+    """
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        with _fonts_lock:
+            font = _fonts.get(key)
+            if font is None:
+                font = ImageFont.truetype(font_path(name), size)
+                _fonts[key] = font
+    return font
+
+
+def clear_font_cache() -> None:
+    """Drop all loaded font faces."""
+    with _fonts_lock:
+        _fonts.clear()
@@ -0,0 +1,121 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+
+class IncrementalVillageLayer:
+    """Keeps the all-villages layer of the last rendered snapshot and updates it from ownership diffs.
+
+    The village layer colors every village by whether it is barbarian or player owned, and
+    consecutive snapshots only differ in a few villages (new or removed villages, villages that
+    were barbed or taken from barbarians). Instead of painting every village again, the new
+    village table is diffed against the previous one by villageid and only the changed cells
+    are repainted on a copy of the previous layer.
+    """
+
+    # Above this share of changed villages a full redraw is cheaper than the diff
+    MAX_CHANGED_FRACTION = 0.5
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+
+        self.key = None  # Geometry and colors the layer was drawn with
+        self.layer = None
+        self.villages = None  # villageid -> x_coord, y_coord, code (0 player village, 1 barbarian)
+
+        # Statistics
+        self.full_draws = 0
+        self.incremental_draws = 0
+        self.repainted_cells = 0
+
+    @staticmethod
+    def layer_key(map) -> tuple:
+        return (map.image_width, map.image_height, map.scale, map.cell_size, map.spacing, map.world_origin,
+                map.village_color, map.barbarian_color)
+
+    @staticmethod
+    def village_codes(village_df: pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "x_coord": village_df["x_coord"].to_numpy(),
+                "y_coord": village_df["y_coord"].to_numpy(),
+                "code": (village_df["playerid"] == 0).to_numpy().astype(np.int8),
+            },
+            index=village_df["villageid"].to_numpy(),
+        )
+
+    @staticmethod
+    def cell_keys(villages: pd.DataFrame) -> np.ndarray:
+        return villages["x_coord"].to_numpy(dtype=np.int64) * 1024 + villages["y_coord"].to_numpy(dtype=np.int64)
+
+    def update(self, map) -> Image.Image:
+        """Get the village layer of a map, reusing the layer of the previous snapshot when possible.
+
+        Args:
+            map (Map): Map of the new snapshot.
+
+        Returns:
+            Image.Image: The village layer. It is kept for the next snapshot and must not be drawn on.
+        """
+        villages = self.village_codes(map.village_df)
+        key = self.layer_key(map)
+
+        if self.layer is None or key != self.key or not villages.index.is_unique or not self.villages.index.is_unique:
+            return self._full_draw(map, key, villages)
+
+        previous = self.villages.reindex(villages.index)
+        known = previous["code"].notna().to_numpy()
+        moved = known & ((previous["x_coord"].to_numpy() != villages["x_coord"].to_numpy()) |
+                         (previous["y_coord"].to_numpy() != villages["y_coord"].to_numpy()))
+        changed = ~known | moved | (previous["code"].to_numpy() != villages["code"].to_numpy())
+
+        # Cells to clear: villages that are gone and the old cells of moved villages
+        removed = pd.concat([
+            self.villages.loc[self.villages.index.difference(villages.index)],
+            self.villages.loc[villages.index[moved]],
+        ])
+        # Every village on a touched cell is repainted in table order, so villages sharing
+        # coordinates end up drawn exactly like in a full draw
+        cell_keys = self.cell_keys(villages)
+        touched = np.union1d(cell_keys[changed], self.cell_keys(removed))
+        changed = villages[np.isin(cell_keys, touched)]
+
+        if len(changed) + len(removed) > self.MAX_CHANGED_FRACTION * max(len(villages), 1):
+            return self._full_draw(map, key, villages)
+
+        layer = self.layer.copy()
+        rasterizer = map.rasterizer
+        if len(removed):
+            layer = rasterizer.paint_cells_on_image(
+                layer, removed["x_coord"].to_numpy(), removed["y_coord"].to_numpy(),
+                np.zeros(len(removed), dtype=np.intp), np.zeros((1, 4), dtype=np.uint8), map.cell_size,
+            )
+        if len(changed):
+            layer = rasterizer.paint_cells_on_image(
+                layer, changed["x_coord"].to_numpy(), changed["y_coord"].to_numpy(),
+                changed["code"].to_numpy().astype(np.intp), rasterizer.build_palette([map.village_color, map.barbarian_color]),
+                map.cell_size,
+            )
+
+        self.layer = layer
+        self.villages = villages
+        self.incremental_draws += 1
+        self.repainted_cells += len(changed) + len(removed)
+        self.logger.debug(f"Repainted {len(changed)} changed and {len(removed)} removed villages of {len(villages)}")
+        return layer
+
+    def _full_draw(self, map, key: tuple, villages: pd.DataFrame) -> Image.Image:
+        layer = Image.new("RGBA", (map.image_width, map.image_height), (0, 0, 0, 0))
+        # draw player villages
+        map.draw(map.village_df, None, image=layer)
+        # draw barbarian villages
+        map.draw(map.village_df, "barbarian", image=layer)
+
+        self.key = key
+        self.layer = layer
+        self.villages = villages
+        self.full_draws += 1
+        self.repainted_cells += len(villages)
+        return layer
@@ -0,0 +1,70 @@
+from typing import Tuple
+
+from PIL import Image
+
+
+class LayerStack:
+    """Named RGBA layers of one map over a shared base grid, composited on demand.
+
+    Every layer is a transparent image of the map size that only holds what was drawn on it,
+    e.g. all villages or the overlay of the top tribes. Composites are cached per prefix of
+    layer names, so outputs that share their lower layers (the tribe and the player map both
+    sit on the all-villages layer) only composite those once, and a layer that already exists
+    is never rasterized again.
+    """
+
+    def __init__(self, base: Image.Image):
+        """Create an empty stack.
+
+        Args:
+            base (Image.Image): Opaque RGBA base grid. It is shared and never drawn on.
+        """
+        self.base = base
+        self.layers = {}
+        self._composites = {(): base}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.layers
+
+    def new_layer(self, name: str) -> Image.Image:
+        """Create (or replace) a transparent layer to draw on.
+
+        Args:
+            name (str): Layer name.
+
+        Returns:
+            Image.Image: The empty layer.
+        """
+        layer = Image.new("RGBA", self.base.size, (0, 0, 0, 0))
+        self.layers[name] = layer
+        # Composites containing the replaced layer are stale
+        self._composites = {names: image for names, image in self._composites.items() if name not in names}
+        return layer
+
+    def set_layer(self, name: str, layer: Image.Image) -> None:
+        """Use an already drawn layer, e.g. one kept from the previous snapshot. It is not drawn on.
+
+        Args:
+            name (str): Layer name.
+            layer (Image.Image): Transparent RGBA layer of the map size.
+        """
+        self.layers[name] = layer
+        self._composites = {names: image for names, image in self._composites.items() if name not in names}
+
+    def _flatten(self, names: Tuple[str, ...]) -> Image.Image:
+        composite = self._composites.get(names)
+        if composite is None:
+            composite = Image.alpha_composite(self._flatten(names[:-1]), self.layers[names[-1]])
+            self._composites[names] = composite
+        return composite
+
+    def composite(self, *names: str) -> Image.Image:
+        """Composite the base and the given layers, bottom to top.
+
+        Args:
+            *names (str): Layer names in drawing order.
+
+        Returns:
+            Image.Image: A new image that may be drawn on.
+        """
+        return self._flatten(tuple(names)).copy()
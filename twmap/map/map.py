@@ -1,11 +1,16 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from sklearn.cluster import KMeans 
 
 from twmap.snapshot.datafilter import DataFilter
 from twmap.map.colors import ColorManager
+from twmap.map.raster import MapRasterizer, BaseGridKey, get_base_grid
+from twmap.map.layers import LayerStack
+from twmap.map.incremental import IncrementalVillageLayer
+from twmap.map.font_registry import get_font
 
 from typing import List, Tuple
 
@@ -14,7 +19,6 @@ from datetime import timezone, datetime
 import urllib.parse
 
 import logging
-from copy import deepcopy
 from scipy.spatial import ConvexHull
 
 
@@ -48,13 +52,14 @@ class Map:
                 output_resolution: str = "4K", 
                 apply_aspect_ratio: bool = True, 
                 server: str = None, 
-                world: str = None
+                world: str = None,
+                incremental_layer: IncrementalVillageLayer = None
                 ):
         """Load with data to create a map
 
         Args:
             data_filter (DataFilter): _description_
-            initial_map (Image, optional): _description_. Defaults to None.
+            initial_map (Image, optional): Base grid to draw on, e.g. from get_base_grid. It is never drawn on itself. Defaults to None.
             player_list (List[str], optional): _description_. Defaults to None.
             tribe_list (List[str], optional): _description_. Defaults to None.
             custom_color_map (dict, optional): _description_. Defaults to None.
@@ -64,6 +69,8 @@ class Map:
             image_type (str, optional): _description_. Defaults to "tribe".
             server (str, optional): _description_. Defaults to None.
             world (str, optional): _description_. Defaults to None.
+            incremental_layer (IncrementalVillageLayer, optional): Village layer of the previously rendered snapshot,
+                updated from the ownership diff instead of drawing all villages. Defaults to None.
         """
 
         # Enable logging
@@ -78,14 +85,8 @@ class Map:
         self.tribe_df = data_filter.tribe_df
         self.conquer_df = data_filter.conquer_df
         
-        # Specific data filters to generate a map
-        self.t10_players_v = self.data_filter.get_t10_player_villages()
-        self.t10_tribes_v = self.data_filter.get_t10_tribe_villages()
-        self.t10_players = self.data_filter.get_t10_players()
-        self.t10_tribes = self.data_filter.get_t10_tribes()
-
-        self.past_day_conquers_p10 = self.data_filter.get_past_day_t10_conquers_players()
-        self.past_day_conquers_t10 = self.data_filter.get_past_day_t10_conquers_tribes()
+        # Specific data filters to generate a map are computed by the data filter on first use,
+        # see the t10_* and past_day_conquers_* properties
         
         # Information specific to a snapshot
         self.printed_datetime = data_filter.printed_timestamp
@@ -119,6 +120,7 @@ class Map:
         self.world_origin = 500
 
         # world drawing configurations
+        self.max_coords = max_coords
         self.world_height = self.world_origin + max_coords  # Controlling how much of the world to include in the image
         self.world_width = self.world_origin + max_coords
         self.show_grid = True  # Whether to draw grid lines for continents
@@ -147,6 +149,8 @@ class Map:
         
         self.cell_size = self.scale  # size for each village cell in pixels
 
+        self.rasterizer = MapRasterizer(self.image_width, self.image_height, self.scale, self.cell_size, self.spacing, self.world_origin)
+
         self.logger.info(f"Selected scaling factor: {self.scale:.2f} (cell size: {self.cell_size}px) for output resolution {output_resolution} ({self.image_width}x{self.image_height})")
 
         self.add_date_time = True
@@ -175,14 +179,19 @@ class Map:
         self.grid_color = self.color_manager.grid_color
 
         self.font_size = 48
-        self.font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", self.font_size)  # Load the font here
+        self.font = get_font(self.font_size)
 
         if initial_map:
-            self.image = initial_map
-            self.initial_image = initial_map  # Store the initial image for resetting between map generations    
+            # The base may be shared between maps, so only copies of it are drawn on
+            self.initial_image = initial_map  # Store the initial image for resetting between map generations
+            self.image = initial_map.copy()
         else:
             self.initial_image = self.initial_map()
 
+        # Villages and overlays are drawn on separate layers over the shared base grid
+        self.layers = LayerStack(self.initial_image)
+        self.incremental_layer = incremental_layer
+
         self.entity_centroids = {}
     
     def draw_tribal_map(self) -> Tuple[Image.Image, Image.Image]:
@@ -190,25 +199,18 @@ class Map:
         Draw the tribal map with villages colored by tribe and a legend of top tribes.
         """
         
-        # draw player villages
-        self.draw(self.village_df, None)
-
-        # draw barbarian villages
-        self.draw(self.village_df, "barbarian")
-        
-        # these drawings are used as a base for the player/tribe specific maps, so we save them before drawing the specific villages on top
-        self.copy_map = deepcopy(self.image)
+        # draw player and barbarian villages once, both maps are composited on top of this layer
+        self.draw_village_layer()
         
         # TOP TRIBE DRAWINGS
-        top_tribes_image = self.draw_top_tribes(zones_of_control=False, center_text=True)
+        top_tribes_image = self.draw_top_tribes(zones_of_control=False, center_text=True, base_layers=("villages",))
         top_tribes_image_with_legend = self.draw_legend(top_type="tribes")
         final_tribe_image = self.finalize_image(image_type="tribes")
 
         # Resetting
-        self.image = self.copy_map
         self.color_manager.reset_color_index()
         
-        top_player_image = self.draw_top_players(center_text=True)
+        top_player_image = self.draw_top_players(center_text=True, base_layers=("villages",))
         top_player_image_with_legend = self.draw_legend(top_type="players")
         final_player_image = self.finalize_image(image_type="players")
 
@@ -231,7 +233,13 @@ class Map:
         return image_x, image_y
 
     def initial_map(self):
-        """Create an initial map with all player villages and barbarians.
+        """Create an initial map with the empty grid of village cells.
+
+        The grid only depends on the world size, output resolution and colors, so it is
+        rasterized once per process and every map starts from a copy of it.
+
+        Returns:
+            Image: The shared base grid, self.image is set to a copy of it.
         """
         
         # draw a grid pattern with each box representing a village
@@ -241,26 +249,17 @@ class Map:
         else:
             cell_color = self.cell_color
             background_color = self.background_color
-        
-        self.image = Image.new("RGBA", (self.image_width, self.image_height), background_color)
-        
-        draw = ImageDraw.Draw(self.image)
-
-        for i in range(0, self.world_height * 2):
 
-            for j in range(0, self.world_width * 2):
-                
-                x, y = self.convert_world_to_image_coords(j, i)
+        grid_color = self.grid_color if self.show_grid else None
+        key = BaseGridKey(self.max_coords, self.output_resolution, cell_color, background_color, grid_color, self.grid_interval, self.show_center_lines)
 
-                upper_left = (x - self.cell_size // 2 + self.spacing, y - self.cell_size // 2 + self.spacing)
-                lower_right = (x + self.cell_size // 2 - self.spacing, y + self.cell_size // 2 - self.spacing)
+        base_grid = get_base_grid(key, lambda: self.rasterizer.base_grid(
+            self.world_width, self.world_height, cell_color, background_color,
+            grid_color, self.grid_interval, self.show_center_lines,
+        ))
+        self.image = base_grid.copy()
 
-                draw.rectangle([upper_left, lower_right], fill=cell_color)
-        
-        if self.show_grid:
-            self.draw_grid(self.image, self.grid_color, self.grid_interval, self.show_center_lines)
-
-        return self.image
+        return base_grid
     
     def finalize_image(self, image_type: str = None):
         """Apply final touches to the image
@@ -279,12 +278,52 @@ class Map:
 
         return self.image
     
-    def draw_top_players(self, zones_of_control: bool = False, center_text: bool = False):
+    @property
+    def t10_players_v(self) -> DataFrame:
+        return self.data_filter.get_t10_player_villages()
+
+    @property
+    def t10_tribes_v(self) -> DataFrame:
+        return self.data_filter.get_t10_tribe_villages()
+
+    @property
+    def t10_players(self) -> DataFrame:
+        return self.data_filter.get_t10_players()
+
+    @property
+    def t10_tribes(self) -> DataFrame:
+        return self.data_filter.get_t10_tribes()
+
+    @property
+    def past_day_conquers_p10(self) -> DataFrame:
+        return self.data_filter.get_past_day_t10_conquers_players()
+
+    @property
+    def past_day_conquers_t10(self) -> DataFrame:
+        return self.data_filter.get_past_day_t10_conquers_tribes()
+
+    def draw_village_layer(self) -> Image:
+        """Draw all player and barbarian villages on the "villages" layer, once per map."""
+        if "villages" in self.layers:
+            pass
+        elif self.incremental_layer is not None:
+            self.layers.set_layer("villages", self.incremental_layer.update(self))
+        else:
+            layer = self.layers.new_layer("villages")
+            # draw player villages
+            self.draw(self.village_df, None, image=layer)
+            # draw barbarian villages
+            self.draw(self.village_df, "barbarian", image=layer)
+        return self.layers.layers["villages"]
+
+    def draw_top_players(self, zones_of_control: bool = False, center_text: bool = False, base_layers: Tuple[str, ...] = ()):
         # logging.info(f"Drawing {len(self.t10_players_v)} villages of top 10 players")
         # logging.info(f"Found {len(self.t10_players)} top players")
-        self.image = deepcopy(self.initial_image)
-        self.draw(self.t10_players_v, "playerid")
-        self.draw(self.past_day_conquers_p10, "playerid", 3)
+        # Overlay on its own layer, composited over the empty grid or the given base layers (e.g. "villages")
+        overlay = self.layers.new_layer("top_players")
+        self.draw(self.t10_players_v, "playerid", image=overlay)
+        self.draw(self.past_day_conquers_p10, "playerid", 3, image=overlay)
+        self.image = self.layers.composite(*base_layers, "top_players")
         # Call the function to draw zones of control for the top 10 player villages
         if zones_of_control:
             self.draw_zones_of_control(self.t10_players_v, 10)
@@ -293,11 +332,13 @@ class Map:
         self.color_manager.reset_color_index()
         return self.image
     
-    def draw_top_tribes(self, zones_of_control: bool = False, center_text: bool = False):
+    def draw_top_tribes(self, zones_of_control: bool = False, center_text: bool = False, base_layers: Tuple[str, ...] = ()):
         # logging.info(f"Drawing {len(self.t10_tribes_v)} villages of top 10 tribes")
         # logging.info(f"Found {len(self.t10_tribes)} top tribes")
-        self.draw(self.t10_tribes_v, "tribeid")
-        self.draw(self.past_day_conquers_t10, "tribeid", 3)
+        overlay = self.layers.new_layer("top_tribes")
+        self.draw(self.t10_tribes_v, "tribeid", image=overlay)
+        self.draw(self.past_day_conquers_t10, "tribeid", 3, image=overlay)
+        self.image = self.layers.composite(*base_layers, "top_tribes")
         if zones_of_control:
             self.draw_influence_zones(self.t10_tribes_v, 10, "tribeid", "clusters")
         if center_text:
@@ -317,7 +358,7 @@ class Map:
     
     def draw_specific_tribes(self, zones_of_control: bool = False, center_text: bool = False):
         logging.info(f"Drawing {len(self.tribe_village)} villages of specific tribes")
-        self.image = deepcopy(self.initial_image)
+        self.image = self.initial_image.copy()
         self.draw(self.tribe_village, "tribeid")
         self.draw(self.tribe_conquer, "tribeid", 3)
         if zones_of_control:
@@ -379,9 +420,9 @@ class Map:
             return legend_image
 
         title_font_size = int(self.font_size * 1.2)
-        title_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", title_font_size)
-        subtitle_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", int(self.font_size * 0.9))
-        body_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", int(self.font_size * 0.7))
+        title_font = get_font(title_font_size)
+        subtitle_font = get_font(int(self.font_size * 0.9))
+        body_font = get_font(int(self.font_size * 0.7))
 
         draw.text((legend_width // 2, 18), f"War Overview ({window_days}d)", fill=self.tw_color, font=title_font, anchor="mt")
         draw.line([30, 65, legend_width - 30, 65], fill=self.tw_color, width=2)
@@ -595,9 +636,9 @@ class Map:
             raise ValueError("Invalid graph_type. Expected 'points', 'killall', 'villages', or 'conquers'.")
 
         graph_font_size = max(24, int(self.font_size * 0.78))
-        graph_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", graph_font_size)
+        graph_font = get_font(graph_font_size)
         title_font_size = int(graph_font_size * 1.35)
-        title_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", title_font_size)
+        title_font = get_font(title_font_size)
         item_count = len(graph_items)
         row_height = int(graph_font_size * 1.28)
         graph_height = max(720, (item_count * row_height) + title_font_size + 120)
@@ -686,7 +727,7 @@ class Map:
         
         # Draw the title text at the top of the map
         title_font_size = int(self.font_size * 2.2)
-        title_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", title_font_size)
+        title_font = get_font(title_font_size)
         
         draw.text((self.image.width // 2, 50), title_text, fill=self.tw_color, font=title_font, anchor="mm")
         
@@ -814,7 +855,7 @@ class Map:
 
         color = self.color_manager.get_color_without_force(summary["tribeid"])
 
-        title_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", int(self.font_size * 1.4))
+        title_font = get_font(int(self.font_size * 1.4))
         draw.text((legend_width // 2, 24), "World Dominance", fill=self.tw_color, font=title_font, anchor="mt")
 
         tribe_label = f"Leading tribe: {summary['tribe_tag']}".strip()
@@ -845,33 +886,47 @@ class Map:
 
         return graph
 
-    def draw(self, village_df: DataFrame, field: str, size_multiplier: float = 1.0):
-
-        draw = ImageDraw.Draw(self.image)
-
-        # Draw foreground cells for each cell in the world
-
-        for _, village in village_df.iterrows():
-
-            if field == "playerid":
-                color = self.color_manager.get_color(village['playerid'])
-            elif field == "tribeid":
-                color = self.color_manager.get_color(village['tribeid'])
-            elif field == "barbarian" and village['playerid'] == 0:
-                color = self.barbarian_color
-            else:
-                color = self.village_color
-
-            image_x, image_y = self.convert_world_to_image_coords(village['x_coord'], village['y_coord'])
+    def draw(self, village_df: DataFrame, field: str, size_multiplier: float = 1.0, image: Image = None):
+        """Draw one cell per village, colored by the given field.
 
-            cell_size = self.cell_size * size_multiplier
+        All villages are painted in a single batch: ids are mapped to palette indices once
+        and the cells are rasterized together instead of one rectangle per row.
 
-            upper_left = (image_x - cell_size // 2 + self.spacing, image_y - cell_size // 2 + self.spacing)
-            lower_right = (image_x + cell_size // 2 - self.spacing, image_y + cell_size // 2 - self.spacing)
+        Args:
+            village_df (DataFrame): Villages to draw, with x_coord and y_coord columns.
+            field (str): "playerid" or "tribeid" to color by owner, "barbarian" to highlight
+                barbarian villages, anything else draws plain village cells.
+            size_multiplier (float, optional): Scale of the cell size. Defaults to 1.0.
+            image (Image, optional): Image or layer to draw on. Defaults to None (self.image).
+        """
 
-            draw.rectangle([upper_left, lower_right], fill=color)
+        target = self.image if image is None else image
+        if village_df.empty:
+            return target
+
+        if field in ("playerid", "tribeid"):
+            # Colors are handed out in order of first appearance, as when drawing row by row
+            color_codes, entity_ids = pd.factorize(village_df[field], use_na_sentinel=False)
+            colors = [self.color_manager.get_color(entity_id) for entity_id in entity_ids]
+        elif field == "barbarian":
+            color_codes = (village_df["playerid"] == 0).to_numpy().astype(np.intp)
+            colors = [self.village_color, self.barbarian_color]
+        else:
+            color_codes = np.zeros(len(village_df), dtype=np.intp)
+            colors = [self.village_color]
+
+        target = self.rasterizer.paint_cells_on_image(
+            target,
+            village_df["x_coord"].to_numpy(),
+            village_df["y_coord"].to_numpy(),
+            color_codes,
+            self.rasterizer.build_palette(colors),
+            self.cell_size * size_multiplier,
+        )
+        if image is None:
+            self.image = target
 
-        return self.image
+        return target
     
     def draw_grid(self, image: Image, color: str, grid_spacing: int, show_center_lines: bool = True):
         """Draw a grid around the center of the image, with grid spacing
@@ -902,14 +957,14 @@ class Map:
     def add_current_date_time(self):
         draw = ImageDraw.Draw(self.image)
         date_time_font_size = int(self.font_size * 2.0)
-        date_time_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", date_time_font_size)
+        date_time_font = get_font(date_time_font_size)
         draw.text((self.legend_width, self.image.height - 10), self.printed_datetime + " UTC", fill=self.tw_color, font=date_time_font, anchor="lb")
         return self.image
 
     def watermark(self, text: str = "@tw-timelapse"):
         draw = ImageDraw.Draw(self.image)
         watermark_font_size = int(self.font_size * 2)
-        watermark_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", watermark_font_size)
+        watermark_font = get_font(watermark_font_size)
         draw.text((self.image.width - 10 - self.legend_width, self.image.height - 10), text, fill=self.tw_color, font=watermark_font, anchor="rb")
         return self.image
         
@@ -917,6 +972,49 @@ class Map:
         """Save the image to file."""
         self.image.save(filename, quality=95)
 
+    def draw_translucent_label(self, xy: tuple, text: str, font, fill: tuple, stroke_width: int, opacity: float = 0.65):
+        """Draw a centered label with a black stroke at a global opacity onto self.image.
+
+        The label is drawn on a transparent tile the size of its bounding box and only that
+        region of the image is composited, instead of a full-size layer per label.
+
+        Args:
+            xy (tuple): Center of the label in image pixels.
+            text (str): Label text.
+            font (ImageFont.FreeTypeFont): Font of the label.
+            fill (tuple): RGBA text color.
+            stroke_width (int): Width of the black stroke.
+            opacity (float, optional): Opacity of the entire label (fill + stroke). Defaults to 0.65.
+        """
+        if self.image.mode != "RGBA":
+            self.image = self.image.convert("RGBA")
+
+        x, y = xy
+        left, top, right, bottom = ImageDraw.Draw(self.image).textbbox(
+            (x, y), text, font=font, anchor="mm", stroke_width=stroke_width
+        )
+        # Whole pixels around the box, so the tile origin is an integer offset of the label position
+        left, top, right, bottom = int(left) - 1, int(top) - 1, int(right) + 2, int(bottom) + 2
+        tile = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+        ImageDraw.Draw(tile, "RGBA").text(
+            (x - left, y - top),
+            text,
+            fill=fill,
+            font=font,
+            anchor="mm",
+            stroke_width=stroke_width,
+            stroke_fill=(0, 0, 0, 255),
+        )
+        tile.putalpha(tile.getchannel("A").point([int(p * opacity) for p in range(256)]))
+
+        # Only the part of the tile inside the image is composited
+        box = (max(left, 0), max(top, 0), min(right, self.image.width), min(bottom, self.image.height))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return self.image
+        tile = tile.crop((box[0] - left, box[1] - top, box[2] - left, box[3] - top))
+        self.image.alpha_composite(tile, dest=(box[0], box[1]))
+        return self.image
+
     def draw_centroid_text(self, village_df: DataFrame, top_n: int = 10, filter_type: str = "playerid"):
         """
         Draw centroid labels for top entities with scalable font and translucent stroke.
@@ -937,10 +1035,9 @@ class Map:
         if len(village_df) < 20:
             return self.image
 
-        draw = ImageDraw.Draw(self.image, "RGBA")
-
-        # Precompute village counts only once
+        # Precompute village counts and centroids (in world coordinates) only once
         counts = village_df[filter_type].value_counts().to_dict()
+        centroids = village_df.groupby(filter_type)[["x_coord", "y_coord"]].mean()
         selected_ids = [entity[filter_type] for _, entity in top_entities.iterrows()]
         selected_counts = [counts.get(entity_id, 0) for entity_id in selected_ids if counts.get(entity_id, 0) > 0]
 
@@ -952,13 +1049,11 @@ class Map:
 
         for _, entity in top_entities.iterrows():
             entity_id = entity[filter_type]
-            entity_villages = village_df[village_df[filter_type] == entity_id]
-            if entity_villages.empty:
+            if entity_id not in centroids.index:
                 continue
 
-            # Mean directly in world coordinates, then convert once
-            centroid_world_x = float(entity_villages["x_coord"].mean())
-            centroid_world_y = float(entity_villages["y_coord"].mean())
+            centroid_world_x = float(centroids.at[entity_id, "x_coord"])
+            centroid_world_y = float(centroids.at[entity_id, "y_coord"])
             x, y = self.convert_world_to_image_coords(centroid_world_x, centroid_world_y)
 
             village_count = counts.get(entity_id, 0)
@@ -968,33 +1063,14 @@ class Map:
                 scale_factor = 1.0
 
             scaled_font_size = int(self.font_size * scale_factor)
-            scaled_font = ImageFont.truetype("twmap/map/fonts/Roboto_Condensed-Bold.ttf", scaled_font_size)
+            scaled_font = get_font(scaled_font_size)
 
             color = self.color_manager.get_color(entity_id)
             r, g, b = (int(color.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4))
 
             name = urllib.parse.unquote_plus(entity["name"])
             stroke_w = max(2, int(3 * scale_factor))
-            # Draw text on a transparent layer, then alpha-composite for true translucency.
-            text_layer = Image.new("RGBA", self.image.size, (0, 0, 0, 0))
-            text_draw = ImageDraw.Draw(text_layer, "RGBA")
-
-            text_draw.text(
-                (x, y),
-                name,
-                fill=(r, g, b, 255),
-                font=scaled_font,
-                anchor="mm",
-                stroke_width=stroke_w,
-                stroke_fill=(0, 0, 0, 255),
-            )
-
-            # Global opacity for the entire label (fill + stroke).
-            label_opacity = 0.65
-            alpha = text_layer.getchannel("A").point(lambda p: int(p * label_opacity))
-            text_layer.putalpha(alpha)
-
-            self.image = Image.alpha_composite(self.image.convert("RGBA"), text_layer)
+            self.draw_translucent_label((x, y), name, scaled_font, (r, g, b, 255), stroke_w)
 
         return self.image
 
@@ -0,0 +1,291 @@
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageColor
+
+
+class MapRasterizer:
+    """Vectorized drawing of world cells onto an RGBA pixel buffer.
+
+    Uses the same world -> image mapping as Map.convert_world_to_image_coords and the same
+    inclusive rectangle bounds as ImageDraw.rectangle, so buffers built here are pixel
+    identical to the per-cell PIL drawing they replace.
+    """
+
+    def __init__(self, image_width: int, image_height: int, scale: int, cell_size: int, spacing: int = 1, world_origin: int = 500):
+        """Configure the pixel geometry of a map.
+
+        Args:
+            image_width (int): Width of the output image in pixels.
+            image_height (int): Height of the output image in pixels.
+            scale (int): Pixels per world coordinate.
+            cell_size (int): Size of a village cell in pixels.
+            spacing (int, optional): Gap between neighbouring cells in pixels. Defaults to 1.
+            world_origin (int, optional): World coordinate drawn in the image center. Defaults to 500.
+        """
+        self.image_width = image_width
+        self.image_height = image_height
+        self.scale = scale
+        self.cell_size = cell_size
+        self.spacing = spacing
+        self.world_origin = world_origin
+
+    @staticmethod
+    def to_rgba(color) -> tuple:
+        """Convert a PIL color specification (e.g. "#58761b") to an RGBA tuple."""
+        return ImageColor.getcolor(color, "RGBA")
+
+    def world_to_image_x(self, x) -> np.ndarray:
+        """Convert world x coordinates to image pixel columns."""
+        centered_x = np.asarray(x, dtype=np.float64) - self.world_origin
+        return (centered_x * self.scale + self.image_width / 2).astype(np.int64)
+
+    def world_to_image_y(self, y) -> np.ndarray:
+        """Convert world y coordinates to image pixel rows."""
+        centered_y = np.asarray(y, dtype=np.float64) - self.world_origin
+        return (self.image_height / 2 + centered_y * self.scale).astype(np.int64)
+
+    def cell_bounds(self, centers: np.ndarray, cell_size) -> tuple:
+        """Inclusive pixel bounds of cells centered on the given pixel positions.
+
+        Args:
+            centers (np.ndarray): Cell centers in pixels along one axis.
+            cell_size (int | float): Cell size in pixels.
+
+        Returns:
+            tuple: (start, end) arrays, both inclusive like ImageDraw.rectangle.
+        """
+        half = cell_size // 2
+        start = np.floor(centers - half + self.spacing).astype(np.int64)
+        end = np.floor(centers + half - self.spacing).astype(np.int64)
+        return start, end
+
+    @staticmethod
+    def axis_mask(start: np.ndarray, end: np.ndarray, length: int) -> np.ndarray:
+        """Boolean mask of the pixels along one axis covered by any inclusive [start, end] span."""
+        start = np.clip(start, 0, length)
+        stop = np.clip(end + 1, 0, length)
+        visible = start < stop
+        coverage = np.zeros(length + 1, dtype=np.int64)
+        np.add.at(coverage, start[visible], 1)
+        np.add.at(coverage, stop[visible], -1)
+        return np.cumsum(coverage[:length]) > 0
+
+    def fill_column(self, buffer: np.ndarray, x: int, width: int, color: tuple) -> None:
+        """Fill a full-height vertical line the way ImageDraw.line draws it."""
+        half = width // 2
+        start, stop = max(x - half, 0), min(x + half + 1, self.image_width)
+        if start < stop:
+            buffer[:, start:stop] = color
+
+    def fill_row(self, buffer: np.ndarray, y: int, width: int, color: tuple) -> None:
+        """Fill a full-width horizontal line the way ImageDraw.line draws it."""
+        half = width // 2
+        start, stop = max(y - half, 0), min(y + half + 1, self.image_height)
+        if start < stop:
+            buffer[start:stop, :] = color
+
+    def base_grid(self, world_width: int, world_height: int, cell_color: str, background_color: str,
+                  grid_color: str = None, grid_interval: int = 100, show_center_lines: bool = True) -> np.ndarray:
+        """Rasterize the empty world grid: background, one cell per coordinate and continent lines.
+
+        Every world coordinate gets a cell, so the cells form a cartesian product of column
+        spans and row spans. The covered pixels are therefore the outer product of two 1D
+        masks, which is filled with a single broadcast assignment.
+
+        Args:
+            world_width (int): Half the number of world columns to draw.
+            world_height (int): Half the number of world rows to draw.
+            cell_color (str): Color of the village cells.
+            background_color (str): Color between the cells.
+            grid_color (str, optional): Color of the continent lines, None to skip them. Defaults to None.
+            grid_interval (int, optional): Spacing of the continent lines in world coordinates. Defaults to 100.
+            show_center_lines (bool, optional): Draw thicker lines through the world origin. Defaults to True.
+
+        Returns:
+            np.ndarray: (image_height, image_width, 4) uint8 RGBA buffer.
+        """
+        buffer = np.empty((self.image_height, self.image_width, 4), dtype=np.uint8)
+        buffer[:] = self.to_rgba(background_color)
+
+        column_start, column_end = self.cell_bounds(self.world_to_image_x(np.arange(world_width * 2)), self.cell_size)
+        row_start, row_end = self.cell_bounds(self.world_to_image_y(np.arange(world_height * 2)), self.cell_size)
+        column_mask = self.axis_mask(column_start, column_end, self.image_width)
+        row_mask = self.axis_mask(row_start, row_end, self.image_height)
+        buffer[row_mask[:, None] & column_mask[None, :]] = self.to_rgba(cell_color)
+
+        if grid_color is not None:
+            line_color = self.to_rgba(grid_color)
+            offset = self.cell_size // 2
+            for i in range(0, world_height, grid_interval):
+                width = 3 if show_center_lines and i == self.world_origin else 1
+                self.fill_column(buffer, int(self.world_to_image_x(i)) + offset, width, line_color)
+            for j in range(0, world_width, grid_interval):
+                width = 3 if show_center_lines and j == self.world_origin else 1
+                self.fill_row(buffer, int(self.world_to_image_y(j)) + offset, width, line_color)
+
+        return buffer
+
+    def cell_rectangles(self, x, y, cell_size) -> tuple:
+        """Inclusive pixel rectangles of the cells at the given world coordinates.
+
+        Args:
+            x (array-like): World x coordinates.
+            y (array-like): World y coordinates.
+            cell_size (int | float): Cell size in pixels.
+
+        Returns:
+            tuple: (x0, y0, x1, y1) arrays of inclusive pixel bounds.
+        """
+        x0, x1 = self.cell_bounds(self.world_to_image_x(x), cell_size)
+        y0, y1 = self.cell_bounds(self.world_to_image_y(y), cell_size)
+        return x0, y0, x1, y1
+
+    @staticmethod
+    def paint_rectangles(buffer: np.ndarray, rectangles: tuple, color_codes: np.ndarray, palette: np.ndarray) -> np.ndarray:
+        """Paint equally sized rectangles into an RGBA buffer in one pass.
+
+        Rectangles are painted in order, so where enlarged cells overlap the later one wins,
+        exactly like consecutive ImageDraw.rectangle calls. Each covered pixel is labelled with
+        the index of the last rectangle over it and then colored with a single gather.
+
+        Args:
+            buffer (np.ndarray): (height, width, 4) uint8 buffer, modified in place.
+            rectangles (tuple): (x0, y0, x1, y1) inclusive bounds in buffer pixels.
+            color_codes (np.ndarray): Palette index of every rectangle.
+            palette (np.ndarray): (n_colors, 4) uint8 RGBA colors.
+
+        Returns:
+            np.ndarray: The painted buffer.
+        """
+        x0, y0, x1, y1 = rectangles
+        if len(x0) == 0:
+            return buffer
+
+        width = int(x1[0] - x0[0]) + 1
+        height = int(y1[0] - y0[0]) + 1
+        buffer_height, buffer_width = buffer.shape[:2]
+        left, right = max(int(x0.min()), 0), min(int(x1.max()) + 1, buffer_width)
+        top, bottom = max(int(y0.min()), 0), min(int(y1.max()) + 1, buffer_height)
+        if width <= 0 or height <= 0 or left >= right or top >= bottom:
+            return buffer
+
+        label = np.full((bottom - top, right - left), -1, dtype=np.int64)
+        order = np.broadcast_to(np.arange(len(x0))[:, None], (len(x0), width))
+        columns = x0[:, None] + np.arange(width)
+        columns_visible = (columns >= left) & (columns < right)
+
+        # Walk the cell footprint one pixel row at a time to keep temporaries at n_cells * width.
+        for dy in range(height):
+            rows = y0 + dy
+            visible = ((rows >= top) & (rows < bottom))[:, None] & columns_visible
+            pixel_rows = np.broadcast_to(rows[:, None], columns.shape)[visible] - top
+            np.maximum.at(label, (pixel_rows, columns[visible] - left), order[visible])
+
+        covered = label >= 0
+        region = buffer[top:bottom, left:right]
+        region[covered] = palette[np.asarray(color_codes)[label[covered]]]
+        return buffer
+
+    def paint_cells(self, buffer: np.ndarray, x, y, color_codes: np.ndarray, palette: np.ndarray, cell_size) -> np.ndarray:
+        """Paint one cell per world coordinate into a full-size RGBA buffer.
+
+        Args:
+            buffer (np.ndarray): (image_height, image_width, 4) uint8 buffer, modified in place.
+            x (array-like): World x coordinates.
+            y (array-like): World y coordinates.
+            color_codes (np.ndarray): Palette index of every cell.
+            palette (np.ndarray): (n_colors, 4) uint8 RGBA colors.
+            cell_size (int | float): Cell size in pixels.
+
+        Returns:
+            np.ndarray: The painted buffer.
+        """
+        return self.paint_rectangles(buffer, self.cell_rectangles(x, y, cell_size), color_codes, palette)
+
+    def paint_cells_on_image(self, image: Image.Image, x, y, color_codes: np.ndarray, palette: np.ndarray, cell_size) -> Image.Image:
+        """Paint cells onto a PIL image, only converting the bounding box of the cells.
+
+        Args:
+            image (Image.Image): RGBA image, modified in place.
+            x (array-like): World x coordinates.
+            y (array-like): World y coordinates.
+            color_codes (np.ndarray): Palette index of every cell.
+            palette (np.ndarray): (n_colors, 4) uint8 RGBA colors.
+            cell_size (int | float): Cell size in pixels.
+
+        Returns:
+            Image.Image: The painted image.
+        """
+        x0, y0, x1, y1 = self.cell_rectangles(x, y, cell_size)
+        if len(x0) == 0:
+            return image
+
+        left, top = max(int(x0.min()), 0), max(int(y0.min()), 0)
+        right, bottom = min(int(x1.max()) + 1, image.width), min(int(y1.max()) + 1, image.height)
+        if left >= right or top >= bottom:
+            return image
+
+        region = np.array(image.crop((left, top, right, bottom)))
+        self.paint_rectangles(region, (x0 - left, y0 - top, x1 - left, y1 - top), color_codes, palette)
+        image.paste(Image.fromarray(region), (left, top))
+        return image
+
+    def build_palette(self, colors: list) -> np.ndarray:
+        """Build an (n_colors, 4) uint8 RGBA palette from PIL color specifications."""
+        return np.array([self.to_rgba(color) for color in colors], dtype=np.uint8).reshape(-1, 4)
+
+
+class BaseGridKey(NamedTuple):
+    """Everything a base grid depends on, used as its cache key."""
+    max_coords: int
+    output_resolution: str
+    cell_color: str
+    background_color: str
+    grid_color: Optional[str]
+    grid_interval: int
+    show_center_lines: bool
+
+
+# Base grids only depend on the world size, resolution and colors, so every Map in a
+# process shares one rasterized copy per configuration. A 4K grid is ~33 MB, so only the
+# most recently used grids are kept.
+BASE_GRID_CACHE_SIZE = 4
+_base_grid_cache = OrderedDict()
+_base_grid_lock = threading.Lock()
+
+
+def get_base_grid(key: BaseGridKey, build) -> Image.Image:
+    """Return the cached base grid image for key, building it with build() on first use.
+
+    The returned image is shared and must not be drawn on; callers take a copy().
+
+    Args:
+        key (BaseGridKey): Everything the grid depends on.
+        build (Callable[[], np.ndarray]): Builds the RGBA buffer for a cache miss.
+
+    Returns:
+        Image.Image: The shared base grid image.
+    """
+    with _base_grid_lock:
+        image = _base_grid_cache.get(key)
+        if image is not None:
+            _base_grid_cache.move_to_end(key)
+            return image
+
+    # Rasterize outside the lock, a concurrent miss for the same key only costs a duplicate build
+    image = Image.fromarray(build())
+    with _base_grid_lock:
+        image = _base_grid_cache.setdefault(key, image)
+        _base_grid_cache.move_to_end(key)
+        while len(_base_grid_cache) > BASE_GRID_CACHE_SIZE:
+            _base_grid_cache.popitem(last=False)
+    return image
+
+
+def clear_base_grid_cache() -> None:
+    """Drop all cached base grids."""
+    with _base_grid_lock:
+        _base_grid_cache.clear()
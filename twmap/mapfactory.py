@@ -9,9 +9,14 @@ import logging
 
 from twmap.snapshot.dataloader import DataLoader
 from twmap.snapshot.datafilter import DataFilter
+from twmap.snapshot.requirement import DataRequirement
 from twmap.map.map import Map
+from twmap.map.incremental import IncrementalVillageLayer
 from twmap.world.world_loader import WorldLoader
 from twmap.map.colors import ColorManager
+from twmap.snapshot.snapshot_cache import SnapshotCache
+from twmap.pipeline import SnapshotPipeline
+from twmap.memory_budget import MemoryBudget, RSSSampler, estimate_render_bytes
 
 from typing import List
 import boto3
@@ -20,25 +25,83 @@ from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 import pandas as pd
 import io
 import concurrent.futures
+import multiprocessing
 import tqdm
 import gc
+import threading
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+EXECUTION_MODES = ("thread", "process", "pipeline")
+
+# Per-process MapFactory used by the process pool workers, created once by _init_render_worker
+_worker_map_factory = None
+
+
+def _init_render_worker(world: str, server: str, s3_image_bucket: str, s3_snapshot_bucket: str, max_coords: int, snapshot_cache: SnapshotCache = None,
+                        output_resolution: str = "4K"):
+    """Initialize a render worker process.
+
+    Builds the S3 clients and MapFactory once per process. The base map grid is cached per
+    process as well, so it is only rasterized for the first image a worker renders.
+    """
+    global _worker_map_factory
+    world_loader = WorldLoader(
+        world=world,
+        server=server,
+        s3_image_bucket=s3_image_bucket,
+        s3_snapshot_bucket=s3_snapshot_bucket,
+        init_load=False,
+    )
+    _worker_map_factory = MapFactory(world_loader, max_coords=max_coords, snapshot_cache=snapshot_cache, output_resolution=output_resolution)
+
+
+def _render_in_worker(timelapse_image):
+    """Render one timelapse image in a worker process set up by _init_render_worker."""
+    return _worker_map_factory._process_single_timelapse_image(timelapse_image)
+
+
+def _render_in_worker_measured(timelapse_image):
+    """Render one timelapse image in a worker process and also return the RSS peak of the job.
+
+    Returns:
+        tuple: (success, error_message, peak bytes above the worker's RSS at the start of the job)
+    """
+    with RSSSampler() as sampler:
+        success, error_msg = _worker_map_factory._process_single_timelapse_image(timelapse_image)
+    return success, error_msg, sampler.peak_bytes
+
 
 class MapFactory:
+
+    # Tables and columns read by the top tribe and top player maps and their legends.
+    # killatt, killdef, killtribeatt and killtribedef are never drawn, so they are not downloaded.
+    DATA_REQUIREMENT = DataRequirement({
+        "ally": ["tribeid", "name", "tag", "tribe_points"],
+        "player": ["playerid", "name", "tribeid", "points"],
+        "village": ["villageid", "x_coord", "y_coord", "playerid"],
+        "killall": ["playerid", "units_defeated"],
+        "killall_tribe": ["tribeid", "units_defeated"],
+    })
+    VILLAGE_COUNT_REQUIREMENT = DataRequirement({"village": ["villageid"]})
     
-    def __init__(self, world_loader: WorldLoader, max_coords: int = 300):
+    def __init__(self, world_loader: WorldLoader, max_coords: int = 300, snapshot_cache: SnapshotCache = None,
+                 incremental_render: bool = True, output_resolution: str = "4K"):
         """Create maps for a given world loader
 
         Args:
             world_loader (WorldLoader): Contains the world configuration and S3 bucket info
             custom_color_map (dict, optional): _description_. Defaults to None.
             max_coords (int, optional): _description_. Defaults to 300.
+            snapshot_cache (SnapshotCache, optional): Local cache for snapshot files. Defaults to None.
+            incremental_render (bool, optional): Update the village layer of the previous snapshot rendered by
+                the same worker thread instead of drawing every village again. Defaults to True.
+            output_resolution (str, optional): Resolution of the maps, see Map.OUTPUT_RESOLUTIONS. Defaults to "4K".
         """
 
         self.world_loader = world_loader
-        self.data_loader = DataLoader(world_loader)
+        self.snapshot_cache = snapshot_cache
+        self.data_loader = DataLoader(world_loader, snapshot_cache=snapshot_cache)
         
         self.s3_data_bucket = world_loader.s3_snapshot_bucket
         self.s3_map_bucket = world_loader.s3_image_bucket
@@ -47,42 +110,96 @@ class MapFactory:
             
         self.custom_color_map = ColorManager().default_colors
         self.max_coords = max_coords
+        self.output_resolution = output_resolution
 
         self.initial_image = None  # Store the initial blank image for resetting between map generations
-    
+
+        # Every render thread keeps the village layer of the last snapshot it rendered,
+        # snapshots are handed out in time order so consecutive renders differ in few villages
+        self.incremental_render = incremental_render
+        self._render_state = threading.local()
+
+    def close(self) -> None:
+        """Shut down the fetch threads of the data loader, see DataLoader.close."""
+        self.data_loader.close()
+
     def create_top_10_map(self, data_filter: DataFilter):
         # Convert the timestamp string from YYYYMMDD_HHMMSS format to datetime
 
         logging.info(f"Creating maps for world {data_filter.world_id} at time {data_filter.printed_timestamp}")
         
+        top_tribe, top_player = self.render_top_10_maps(data_filter)
+        
+        # add to s3
+        timestamp_str = pd.to_datetime(data_filter.printed_timestamp).strftime("%Y%m%d_%H%M%S")
+
+        # Convert images to bytes before uploading
+        players_image_bytes = self.pil_to_bytes(top_player)
+        tribes_image_bytes = self.pil_to_bytes(top_tribe)
+
+        self.upload_top_10_maps(timestamp_str, tribes_image_bytes, players_image_bytes)
+
+    def render_top_10_maps(self, data_filter: DataFilter) -> tuple:
+        """Render the top tribe and top player maps of one snapshot.
+
+        Args:
+            data_filter (DataFilter): Filtered data of the snapshot.
+
+        Returns:
+            tuple: (top tribe image, top player image)
+        """
         logging.info(f"Creating top player map for world {data_filter.world_id} at time {data_filter.printed_timestamp}")
         
         map = Map(
                   data_filter,
                   max_coords=self.max_coords,
-                  output_resolution="4K",
+                  output_resolution=self.output_resolution,
                   apply_aspect_ratio=True,
                   server=self.world_loader.server,
-                  world=self.world_loader.world
+                  world=self.world_loader.world,
+                  incremental_layer=self.incremental_village_layer()
                 )
         
-        top_tribe, top_player = map.draw_tribal_map()
-        
-        # Convert PIL Images to bytes for S3 upload
-        def pil_to_bytes(pil_image):
-            """Convert PIL Image to bytes"""
-            img_buffer = io.BytesIO()
-            pil_image.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            return img_buffer.getvalue()
-        
-        # add to s3
-        timestamp_str = pd.to_datetime(data_filter.printed_timestamp).strftime("%Y%m%d_%H%M%S")
+        return map.draw_tribal_map()
 
-        # Convert images to bytes before uploading
-        players_image_bytes = pil_to_bytes(top_player)
-        tribes_image_bytes = pil_to_bytes(top_tribe)
+    def incremental_village_layer(self) -> IncrementalVillageLayer:
+        """Get the incremental village layer of the calling thread, None when incremental rendering is off."""
+        if not self.incremental_render:
+            return None
+        village_layer = getattr(self._render_state, "village_layer", None)
+        if village_layer is None:
+            village_layer = IncrementalVillageLayer()
+            self._render_state.village_layer = village_layer
+        return village_layer
+
+    def count_villages(self, snapshot) -> int:
+        """Number of villages of a snapshot, loading only the villageid column. 0 when it cannot be loaded.
+
+        Args:
+            snapshot (SnapshotFileModel): Snapshot to count, e.g. a TimelapseImageModel.
+        """
+        village_df = self.data_loader.load_snapshot(snapshot, self.VILLAGE_COUNT_REQUIREMENT)[2]
+        if village_df is None:
+            logging.warning(f"Could not count the villages of snapshot {snapshot.timestamp}, estimating without them")
+            return 0
+        return len(village_df)
+
+    @staticmethod
+    def pil_to_bytes(pil_image) -> bytes:
+        """Convert PIL Image to PNG bytes for S3 upload"""
+        img_buffer = io.BytesIO()
+        pil_image.save(img_buffer, format='PNG')
+        img_buffer.seek(0)
+        return img_buffer.getvalue()
 
+    def upload_top_10_maps(self, timestamp_str: str, tribes_image_bytes: bytes, players_image_bytes: bytes):
+        """Upload the encoded top tribe and top player maps of one snapshot.
+
+        Args:
+            timestamp_str (str): Snapshot time as YYYYMMDD_HHMMSS.
+            tribes_image_bytes (bytes): PNG of the top tribe map.
+            players_image_bytes (bytes): PNG of the top player map.
+        """
         self.s3_client.put_object(
             Bucket=self.s3_map_bucket, 
             Key=self.world_loader.top_players_image_prefix + timestamp_str + ".png", 
@@ -131,6 +248,7 @@ class MapFactory:
             killdef_key = extract_s3_key(timelapse_image.killdef_data_path) if timelapse_image.killdef_data_path else None
             killtribeatt_key = extract_s3_key(timelapse_image.killtribeatt_data_path) if timelapse_image.killtribeatt_data_path else None
             killtribedef_key = extract_s3_key(timelapse_image.killtribedef_data_path) if timelapse_image.killtribedef_data_path else None
+            columnar_key = extract_s3_key(timelapse_image.columnar_data_path) if timelapse_image.columnar_data_path else None
 
             logging.info(f"Loading data files from S3 for timestamp {timelapse_image.timestamp}")
             logging.info(f"Tribe data path: s3://{self.s3_data_bucket}/{ally_key}")
@@ -141,7 +259,8 @@ class MapFactory:
             try:
                 # Load data files using the data loader
                 tribe_df, player_df, village_df, conquer_df, killall_df, killalltribes_df, killatt_df, killdef_df, killtribeatt_df, killtribedef_df = self.data_loader.load_specific_files(
-                    ally_key, player_key, village_key, conquer_key, killall_key, killalltribes_key, killatt_key, killdef_key, killtribeatt_key, killtribedef_key
+                    ally_key, player_key, village_key, conquer_key, killall_key, killalltribes_key, killatt_key, killdef_key, killtribeatt_key, killtribedef_key,
+                    columnar_path=columnar_key, requirement=self.DATA_REQUIREMENT,
                 )
                 
                 # Create data filter
@@ -200,7 +319,18 @@ class MapFactory:
         
         logging.info(f"Completed clearing maps from S3 bucket {self.s3_map_bucket} for world {self.world_loader.world}")
 
-    def generate_missing_maps(self, max_workers: int = 4, regenerate_all: bool = False, interval: int = 1):
+    @staticmethod
+    def _release_measured_job(memory_budget: MemoryBudget, reservation: tuple):
+        """Done callback releasing the reservation of a job run by _render_in_worker_measured."""
+        def release(future):
+            peak_bytes = None
+            if not future.cancelled() and future.exception() is None:
+                peak_bytes = future.result()[2]
+            memory_budget.release(reservation, peak_bytes, isolated=True)
+        return release
+
+    def generate_missing_maps(self, max_workers: int = 4, regenerate_all: bool = False, interval: int = 1, execution_mode: str = "thread",
+                              pipeline_options: dict = None, memory_budget_mb: int = None):
         """Generate maps for all snapshots in the world loader that are missing in the S3 map bucket.
         
         Args:
@@ -208,7 +338,21 @@ class MapFactory:
             regenerate_all (bool): If True, regenerate ALL maps (overwriting existing ones).
                                  If False, only generate missing maps.
             interval (int): Generate every Nth image (1=all, 2=every 2nd, 3=every 3rd, etc.)
+            execution_mode (str): "thread" renders in a thread pool of this process.
+                                 "process" renders in a pool of worker processes, each with its own
+                                 S3 clients and base map, and only ships the TimelapseImageModel per image.
+                                 "pipeline" runs fetch, parse, render and encode/upload as separate stages
+                                 with bounded queues in between, so downloads overlap rendering.
+            pipeline_options (dict, optional): Keyword arguments for SnapshotPipeline (per stage workers,
+                                 prefetch and queue sizes). render_workers defaults to max_workers.
+            memory_budget_mb (int, optional): RSS budget in MiB. Jobs are only started while their estimated
+                                 peak fits under it next to the jobs in flight, and the measured peak per job
+                                 is logged. In process mode the budget covers the jobs but not the interpreters
+                                 of the worker processes. Defaults to None (max_workers jobs at a time).
         """
+
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Invalid execution_mode '{execution_mode}'. Expected one of {EXECUTION_MODES}.")
         
         if regenerate_all:
             # Get all timelapse images
@@ -250,19 +394,89 @@ class MapFactory:
         successful_count = 0
         failed_count = 0
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all tasks
-            future_to_image = {
-                executor.submit(self._process_single_timelapse_image, img): img 
-                for img in timelapse_images
-            }
+        memory_budget = None
+        if memory_budget_mb:
+            # Worlds only gain villages, so the latest snapshot is the largest
+            villages = self.count_villages(timelapse_images[-1])
+            memory_budget = MemoryBudget(memory_budget_mb * 2**20, estimate_render_bytes(self.output_resolution, villages))
+
+        if execution_mode == "pipeline":
+            pipeline = SnapshotPipeline(self, memory_budget=memory_budget, **{"render_workers": max_workers, **(pipeline_options or {})})
+            logging.info(f"Rendering {len(timelapse_images)} images with a staged pipeline: {pipeline_options or {}}")
+
+            with tqdm.tqdm(total=len(timelapse_images), desc=progress_desc) as pbar:
+                def on_progress(timelapse_image, error_msg):
+                    if error_msg:
+                        logging.error(f"Failed to process {timelapse_image.timestamp}: {error_msg}")
+                    pbar.update(1)
+
+                successful_count, failed_count = pipeline.run(timelapse_images, progress_callback=on_progress)
+
+            pipeline.log_stats()
+            if memory_budget is not None:
+                memory_budget.log_stats()
+            logging.info(f"Completed processing: {successful_count} successful, {failed_count} failed")
+
+            logging.info("Refreshing timelapse images list...")
+            self.world_loader.timelapse_images = self.world_loader.sync_timelapse_images()
+            return
+
+        if execution_mode == "process":
+            # Spawned workers rebuild their clients from the world settings, nothing heavy is pickled
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_render_worker,
+                initargs=(
+                    self.world_loader.world,
+                    self.world_loader.server,
+                    self.world_loader.s3_image_bucket,
+                    self.world_loader.s3_snapshot_bucket,
+                    self.max_coords,
+                    self.snapshot_cache,
+                    self.output_resolution,
+                ),
+            )
+            render = _render_in_worker if memory_budget is None else _render_in_worker_measured
+        elif memory_budget is not None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+            def render(timelapse_image):
+                reservation = memory_budget.acquire()
+                sampler = RSSSampler()
+                try:
+                    with sampler:
+                        return self._process_single_timelapse_image(timelapse_image)
+                finally:
+                    memory_budget.release(reservation, sampler.peak_bytes)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            render = self._process_single_timelapse_image
+
+        logging.info(f"Rendering {len(timelapse_images)} images with {max_workers} {execution_mode} workers")
+
+        with executor:
+            if execution_mode == "process" and memory_budget is not None:
+                # Workers cannot wait on the budget of this process, so jobs are only submitted once they fit
+                future_to_image = {}
+                for img in timelapse_images:
+                    reservation = memory_budget.acquire()
+                    future = executor.submit(render, img)
+                    future.add_done_callback(self._release_measured_job(memory_budget, reservation))
+                    future_to_image[future] = img
+            else:
+                # Submit all tasks
+                future_to_image = {
+                    executor.submit(render, img): img 
+                    for img in timelapse_images
+                }
             
             # Process results with progress bar
             with tqdm.tqdm(total=len(timelapse_images), desc=progress_desc) as pbar:
                 for future in concurrent.futures.as_completed(future_to_image):
                     timelapse_image = future_to_image[future]
                     try:
-                        success, error_msg = future.result()
+                        success, error_msg = future.result()[:2]
                         if success:
                             successful_count += 1
                         else:
@@ -274,6 +488,8 @@ class MapFactory:
                     
                     pbar.update(1)
         
+        if memory_budget is not None:
+            memory_budget.log_stats()
         logging.info(f"Completed processing: {successful_count} successful, {failed_count} failed")
         
         # Refresh the timelapse images list to reflect the newly generated images
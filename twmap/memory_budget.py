@@ -0,0 +1,190 @@
+import logging
+import os
+import resource
+import threading
+import time
+
+from twmap.map.map import Map
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Full-size RGBA images alive at the peak of one render: the village layer and the copy kept
+# for the next snapshot, the overlay layers and their cached composites, the working image,
+# the label layers of draw_centroid_text and the finished tribe map while the player map is drawn.
+FULL_FRAME_COPIES = 12
+
+# PNG buffers, the player and tribe tables and their views of one job, next to the images
+DATA_BYTES_PER_JOB = 64 * 2**20
+# Village table, its group indexes, gathers and label groups grow with the villages of the world
+# (about 270 bytes per village measured on projected, compacted tables, rounded up)
+DATA_BYTES_PER_VILLAGE = 320
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes.
+
+    Read from /proc where available, otherwise the peak RSS reported by getrusage is used.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def estimate_render_bytes(output_resolution: str = "4K", villages: int = 0) -> int:
+    """Estimate the peak memory of rendering the maps of one snapshot.
+
+    Args:
+        output_resolution (str, optional): Output resolution of the maps, see Map.OUTPUT_RESOLUTIONS. Defaults to "4K".
+        villages (int, optional): Villages of a snapshot of the world, e.g. of its latest one. Defaults to 0.
+
+    Returns:
+        int: Estimated peak in bytes.
+    """
+    resolution = Map.OUTPUT_RESOLUTIONS[output_resolution]
+    frame_bytes = resolution["width"] * resolution["height"] * 4
+    return FULL_FRAME_COPIES * frame_bytes + DATA_BYTES_PER_JOB + DATA_BYTES_PER_VILLAGE * villages
+
+
+class RSSSampler:
+    """Measures how far the RSS of this process rises above its starting value during a block.
+
+    A background thread polls the RSS while the block runs. With several jobs running in one
+    process the measured rise includes their allocations as well, so it is an upper bound.
+    """
+
+    def __init__(self, poll_interval: float = 0.05):
+        self.poll_interval = poll_interval
+        self.start_bytes = 0
+        self.max_bytes = 0
+        self.peak_bytes = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.max_bytes = max(self.max_bytes, current_rss())
+
+    def __enter__(self):
+        self.start_bytes = self.max_bytes = current_rss()
+        self._thread = threading.Thread(target=self._poll, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.max_bytes = max(self.max_bytes, current_rss())
+        self.peak_bytes = self.max_bytes - self.start_bytes
+        return False
+
+
+class MemoryBudget:
+    """Admission control for concurrent render jobs under an RSS budget.
+
+    Every job reserves its estimated peak before it starts and only starts while the RSS of the
+    process when the budget was created plus all reservations fit under the budget. One job is
+    always admitted, so a budget below a single job slows rendering down instead of stalling it.
+    Observed job peaks raise the estimate for later jobs when they exceed it. Jobs sharing a
+    process measure each other's allocations as well, so their peaks are only reported.
+    """
+
+    def __init__(self, budget_bytes: int, job_estimate_bytes: int):
+        """Create a budget.
+
+        Args:
+            budget_bytes (int): RSS budget of the process in bytes.
+            job_estimate_bytes (int): Initial estimate of the peak of one job, see estimate_render_bytes.
+        """
+        self.budget_bytes = budget_bytes
+        self.job_estimate_bytes = job_estimate_bytes
+        self.baseline_bytes = current_rss()
+
+        self._condition = threading.Condition()
+        self.reserved_bytes = 0
+        self.in_flight = 0
+        self.admitted = 0
+
+        # Statistics
+        self.max_in_flight = 0
+        self.wait_seconds = 0.0
+        self.job_peaks = []
+
+        if self.baseline_bytes + job_estimate_bytes > budget_bytes:
+            logging.warning(
+                f"Memory budget of {budget_bytes / 2**20:.0f} MiB does not fit one job of {job_estimate_bytes / 2**20:.0f} MiB "
+                f"next to the current {self.baseline_bytes / 2**20:.0f} MiB, rendering one job at a time"
+            )
+
+    def acquire(self) -> tuple:
+        """Block until a job fits under the budget, then reserve its estimate.
+
+        Returns:
+            tuple: Reservation of the job, pass it to release.
+        """
+        started = time.perf_counter()
+        with self._condition:
+            while self.in_flight and self.baseline_bytes + self.reserved_bytes + self.job_estimate_bytes > self.budget_bytes:
+                self._condition.wait()
+            reserved_bytes = self.job_estimate_bytes
+            self.reserved_bytes += reserved_bytes
+            self.in_flight += 1
+            self.admitted += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.wait_seconds += time.perf_counter() - started
+            return reserved_bytes, self.admitted, self.in_flight > 1
+
+    def release(self, reservation: tuple, peak_bytes: int = None, isolated: bool = False) -> None:
+        """Release the reservation of a finished job.
+
+        Args:
+            reservation (tuple): Reservation returned by acquire.
+            peak_bytes (int, optional): Measured peak of the job. Defaults to None (not measured).
+            isolated (bool, optional): The peak was measured in a process of its own (process mode). Defaults to False,
+                then only peaks of jobs that did not overlap other jobs of this process adjust the estimate.
+        """
+        reserved_bytes, admission, overlapped = reservation
+        with self._condition:
+            overlapped = overlapped or self.admitted > admission
+            self.reserved_bytes -= reserved_bytes
+            self.in_flight -= 1
+            if peak_bytes is not None:
+                self.job_peaks.append(peak_bytes)
+                if (isolated or not overlapped) and peak_bytes > self.job_estimate_bytes:
+                    logging.info(
+                        f"Job peaked at {peak_bytes / 2**20:.0f} MiB above the estimate of "
+                        f"{self.job_estimate_bytes / 2**20:.0f} MiB, raising the estimate"
+                    )
+                    self.job_estimate_bytes = peak_bytes
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Statistics of the budget, job peaks in MiB.
+
+        Returns:
+            dict: Budget, current job estimate, jobs measured, max/mean job peak, max jobs in flight and total wait time.
+        """
+        with self._condition:
+            peaks = list(self.job_peaks)
+            return {
+                "budget_mib": round(self.budget_bytes / 2**20, 1),
+                "baseline_mib": round(self.baseline_bytes / 2**20, 1),
+                "job_estimate_mib": round(self.job_estimate_bytes / 2**20, 1),
+                "jobs_measured": len(peaks),
+                "max_job_peak_mib": round(max(peaks) / 2**20, 1) if peaks else None,
+                "mean_job_peak_mib": round(sum(peaks) / len(peaks) / 2**20, 1) if peaks else None,
+                "max_in_flight": self.max_in_flight,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        logging.info(
+            f"Memory budget {stats['budget_mib']} MiB (baseline {stats['baseline_mib']} MiB): "
+            f"job estimate {stats['job_estimate_mib']} MiB, peak per job max {stats['max_job_peak_mib']} MiB / "
+            f"mean {stats['mean_job_peak_mib']} MiB over {stats['jobs_measured']} jobs, "
+            f"at most {stats['max_in_flight']} jobs in flight, waited {stats['wait_seconds']}s"
+        )
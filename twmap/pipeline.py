@@ -0,0 +1,294 @@
+import logging
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from twmap.snapshot.datafilter import DataFilter
+from twmap.memory_budget import MemoryBudget, RSSSampler
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Marks the end of the input of a stage worker
+_STOP = object()
+
+
+class PipelineStage:
+    """One stage of the render pipeline: a pool of worker threads reading from a bounded queue.
+
+    Workers block on a full output queue, so a slow stage holds back the stages before it and
+    at most queue_size items wait between two stages.
+    """
+
+    def __init__(self, name: str, work, workers: int = 1, queue_size: int = 2):
+        """Create a stage.
+
+        Args:
+            name (str): Stage name used in the statistics.
+            work (Callable): Turns the payload of an item into the payload for the next stage.
+            workers (int, optional): Number of worker threads. Defaults to 1.
+            queue_size (int, optional): Capacity of the input queue of the stage. Defaults to 2.
+        """
+        self.name = name
+        self.work = work
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self.on_done = None
+        self.on_error = None
+        self.threads = []
+
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def put(self, item) -> None:
+        """Queue an item for this stage, blocking while the queue is full."""
+        self.queue.put(item)
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self) -> None:
+        """Let the workers finish the queued items, then wait for them to exit."""
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+
+            timelapse_image, payload = item
+            started = time.perf_counter()
+            try:
+                result = self.work(timelapse_image, payload)
+                error = None
+            except Exception as e:
+                logging.error(f"Pipeline stage {self.name} failed for timestamp {timelapse_image.timestamp}: {e}", exc_info=True)
+                error = e
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self.busy_seconds += elapsed
+                if error is None:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+
+            # Drop the payload reference before blocking on the next queue
+            payload = item = None
+            # A failing callback must not kill the worker, the stage would stop taking items
+            try:
+                if error is not None:
+                    self.on_error(timelapse_image, f"{self.name}: {error}")
+                elif self.next_stage is not None:
+                    self.next_stage.put((timelapse_image, result))
+                else:
+                    self.on_done(timelapse_image)
+            except Exception as e:
+                logging.error(f"Pipeline stage {self.name} could not hand off timestamp {timelapse_image.timestamp}: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        """Statistics of the stage.
+
+        Returns:
+            dict: processed/failed items, busy time, throughput with all workers busy and queue depths.
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "items_per_second": round(self.processed / self.busy_seconds * self.workers, 3) if self.busy_seconds else None,
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+
+class SnapshotPipeline:
+    """Staged fetch -> parse -> render -> encode/upload pipeline for the maps of a world.
+
+    Each stage runs in its own threads with its own concurrency, connected by bounded queues,
+    so downloading the next snapshots overlaps parsing and rendering the current ones while the
+    number of snapshots held in memory stays bounded.
+    """
+
+    def __init__(self, map_factory, fetch_workers: int = 2, parse_workers: int = 1, render_workers: int = 2,
+                 upload_workers: int = 2, prefetch: int = 2, queue_size: int = 2, memory_budget: MemoryBudget = None):
+        """Create a pipeline rendering with the data loader and S3 clients of a MapFactory.
+
+        Args:
+            map_factory (MapFactory): Factory whose data loader, renderer and buckets are used.
+            fetch_workers (int, optional): Concurrent snapshot downloads. Defaults to 2.
+            parse_workers (int, optional): Concurrent parse/filter workers. Defaults to 1.
+            render_workers (int, optional): Concurrent map renders. Defaults to 2.
+            upload_workers (int, optional): Concurrent PNG encodes and uploads. Defaults to 2.
+            prefetch (int, optional): Downloaded snapshots that may wait to be parsed. Defaults to 2.
+            queue_size (int, optional): Capacity of the other queues between stages. Defaults to 2.
+            memory_budget (MemoryBudget, optional): Admits a snapshot into the pipeline only while it fits under
+                the budget, from its download until its maps are uploaded. Defaults to None.
+        """
+        self.map_factory = map_factory
+        self.data_loader = map_factory.data_loader
+        self.memory_budget = memory_budget
+        # timestamp -> reserved bytes and measured render peak of the snapshots in flight
+        self._reservations = {}
+        self._render_peaks = {}
+
+        self.stages = [
+            PipelineStage("fetch", self._fetch, fetch_workers, queue_size),
+            PipelineStage("parse", self._parse, parse_workers, prefetch),
+            PipelineStage("render", self._render, render_workers, queue_size),
+            PipelineStage("upload", self._upload, upload_workers, queue_size),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+        for stage in self.stages:
+            stage.on_done = self._done
+            stage.on_error = self._error
+
+        self._lock = threading.Lock()
+        # Admission under the memory budget
+        self.admitted = 0
+        self.admission_wait_seconds = 0.0
+        self.max_admission_wait_seconds = 0.0
+
+        self.successful = []
+        self.failed = []
+        self.progress_callback = None
+
+    def _admit(self, timelapse_image) -> None:
+        """Wait until the snapshot fits under the memory budget and reserve it, before it enters the fetch stage.
+
+        Waiting happens outside the stages, so it does not count as busy time of any stage.
+        """
+        if self.memory_budget is None:
+            return
+        started = time.perf_counter()
+        reservation = self.memory_budget.acquire()
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._reservations[timelapse_image.timestamp] = reservation
+            self.admitted += 1
+            self.admission_wait_seconds += waited
+            self.max_admission_wait_seconds = max(self.max_admission_wait_seconds, waited)
+
+    def _fetch(self, timelapse_image, _):
+        return self.data_loader.fetch_snapshot_files(timelapse_image, self.map_factory.DATA_REQUIREMENT)
+
+    def _parse(self, timelapse_image, files):
+        tribe_df, player_df, village_df, conquer_df, *kill_dfs = self.data_loader.parse_snapshot_files(
+            files, self.data_loader.extract_s3_key(timelapse_image.conquer_data_path), self.map_factory.DATA_REQUIREMENT
+        )
+        if village_df is None:
+            raise ValueError("No village data")
+        return DataFilter(village_df, player_df, tribe_df, conquer_df, *kill_dfs)
+
+    def _render(self, timelapse_image, data_filter):
+        timestamp_str = pd.to_datetime(data_filter.printed_timestamp).strftime("%Y%m%d_%H%M%S")
+        if self.memory_budget is None:
+            top_tribe, top_player = self.map_factory.render_top_10_maps(data_filter)
+        else:
+            with RSSSampler() as sampler:
+                top_tribe, top_player = self.map_factory.render_top_10_maps(data_filter)
+            with self._lock:
+                self._render_peaks[timelapse_image.timestamp] = sampler.peak_bytes
+        return timestamp_str, top_tribe, top_player
+
+    def _upload(self, timelapse_image, rendered):
+        timestamp_str, top_tribe, top_player = rendered
+        self.map_factory.upload_top_10_maps(
+            timestamp_str, self.map_factory.pil_to_bytes(top_tribe), self.map_factory.pil_to_bytes(top_player)
+        )
+        logging.info(f"Successfully generated maps for timestamp {timelapse_image.timestamp}")
+
+    def _release(self, timelapse_image):
+        if self.memory_budget is None:
+            return
+        with self._lock:
+            reservation = self._reservations.pop(timelapse_image.timestamp, None)
+            peak_bytes = self._render_peaks.pop(timelapse_image.timestamp, None)
+        if reservation is not None:
+            self.memory_budget.release(reservation, peak_bytes)
+
+    def _finish(self, timelapse_image, error_msg: str = None):
+        """Release the reservation of a counted image and report its progress, the callback runs even when releasing fails."""
+        try:
+            self._release(timelapse_image)
+        finally:
+            if self.progress_callback:
+                self.progress_callback(timelapse_image, error_msg)
+
+    def _done(self, timelapse_image):
+        with self._lock:
+            self.successful.append(timelapse_image)
+        self._finish(timelapse_image)
+
+    def _error(self, timelapse_image, error_msg: str):
+        with self._lock:
+            self.failed.append((timelapse_image, error_msg))
+        self._finish(timelapse_image, error_msg)
+
+    def run(self, timelapse_images: list, progress_callback=None) -> tuple:
+        """Render the maps of the given timelapse images.
+
+        Args:
+            timelapse_images (list): TimelapseImageModels to render, in the order to fetch them.
+            progress_callback (Callable, optional): Called with (timelapse_image, error_msg or None) per finished image.
+
+        Returns:
+            tuple: (number of successful images, number of failed images)
+        """
+        self.progress_callback = progress_callback
+        for stage in self.stages:
+            stage.start()
+
+        for timelapse_image in timelapse_images:
+            self._admit(timelapse_image)
+            self.stages[0].put((timelapse_image, None))
+
+        # Stop the stages front to back, so every item has left a stage before its successor stops
+        for stage in self.stages:
+            stage.stop()
+
+        return len(self.successful), len(self.failed)
+
+    def stats(self) -> dict:
+        """Per stage statistics, see PipelineStage.stats."""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def admission_stats(self) -> dict:
+        """Statistics of the admission under the memory budget: admitted snapshots and the time spent waiting."""
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "wait_seconds": round(self.admission_wait_seconds, 3),
+                "max_wait_seconds": round(self.max_admission_wait_seconds, 3),
+            }
+
+    def log_stats(self) -> None:
+        if self.memory_budget is not None:
+            stats = self.admission_stats()
+            logging.info(
+                f"Pipeline admission: {stats['admitted']} snapshots admitted under the memory budget, "
+                f"waited {stats['wait_seconds']}s in total, at most {stats['max_wait_seconds']}s for one"
+            )
+        for name, stats in self.stats().items():
+            logging.info(
+                f"Pipeline stage {name}: {stats['processed']} processed, {stats['failed']} failed, "
+                f"{stats['busy_seconds']}s busy over {stats['workers']} workers, {stats['items_per_second']} items/s, "
+                f"max queue depth {stats['max_queue_depth']}"
+            )
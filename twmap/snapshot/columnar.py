@@ -0,0 +1,102 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from twmap.snapshot.snapshot_datamodel import VillageModel, PlayerModel, TribeModel, KillAllModel, KillTribeModel, KillAttModel, KillDefModel, KillTribeAttModel, KillTribeDefModel
+
+# Columnar snapshot files bundle all per-snapshot tables of a world dump in one compressed
+# .npz archive. Integer columns are stored as int32 where the values fit, string columns are
+# dictionary encoded as int32 codes plus the distinct values. conquer.txt is not included,
+# it is shared by the whole world (see ConquerStore).
+
+# table name -> (SnapshotFileModel path attribute, row model), in load_specific_files order
+COLUMNAR_TABLES = {
+    "ally": ("tribe_data_path", TribeModel),
+    "player": ("player_data_path", PlayerModel),
+    "village": ("village_data_path", VillageModel),
+    "killall": ("killall_data_path", KillAllModel),
+    "killall_tribe": ("killall_tribe_data_path", KillTribeModel),
+    "killatt": ("killatt_data_path", KillAttModel),
+    "killdef": ("killdef_data_path", KillDefModel),
+    "killtribeatt": ("killtribeatt_data_path", KillTribeAttModel),
+    "killtribedef": ("killtribedef_data_path", KillTribeDefModel),
+}
+
+
+def columnar_key_for_village(village_key: str) -> str:
+    """Get the columnar file key of the snapshot a village dump belongs to.
+
+    e.g. en146/village_en146_20250930_221458.txt -> en146/columnar/snapshot_en146_20250930_221458.npz
+    """
+    directory, filename = village_key.rsplit("/", 1)
+    world_id = filename.split("_")[1]
+    timestamp = "_".join(filename.split("_")[2:4]).replace(".txt", "")
+    return f"{directory}/columnar/snapshot_{world_id}_{timestamp}.npz"
+
+
+def _compact_ints(values: pd.Series) -> np.ndarray:
+    values = values.to_numpy(dtype=np.int64)
+    info = np.iinfo(np.int32)
+    if values.size == 0 or (values.min() >= info.min and values.max() <= info.max):
+        return values.astype(np.int32)
+    return values
+
+
+def encode_snapshot_tables(tables: dict) -> bytes:
+    """Encode the tables of one snapshot as a columnar .npz archive.
+
+    Args:
+        tables (dict): table name -> (DataFrame, source .txt key). Missing tables are skipped.
+
+    Returns:
+        bytes: The archive contents.
+    """
+    arrays = {}
+    for name, (df, source_path) in tables.items():
+        if df is None:
+            continue
+        model = COLUMNAR_TABLES[name][1]
+        arrays[f"{name}.__source__"] = np.array(source_path)
+        for column, field in model.model_fields.items():
+            if field.annotation is str:
+                codes, uniques = pd.factorize(df[column].astype(str))
+                arrays[f"{name}.{column}.codes"] = codes.astype(np.int32)
+                arrays[f"{name}.{column}.values"] = np.asarray(uniques, dtype=str)
+            else:
+                arrays[f"{name}.{column}"] = _compact_ints(df[column])
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def decode_snapshot_tables(data: bytes, projection: dict = None) -> dict:
+    """Decode a columnar .npz archive written by encode_snapshot_tables.
+
+    Members of the archive are decompressed on access, so tables and columns left out of the
+    projection are never decompressed.
+
+    Args:
+        data (bytes): The archive contents.
+        projection (dict, optional): table name -> columns to decode. Defaults to None (every column of every table).
+
+    Returns:
+        dict: table name -> (DataFrame, source .txt key) for every decoded table in the archive.
+    """
+    tables = {}
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        for name, (_, model) in COLUMNAR_TABLES.items():
+            if f"{name}.__source__" not in archive.files or (projection is not None and name not in projection):
+                continue
+            columns = {}
+            for column, field in model.model_fields.items():
+                if projection is not None and column not in projection[name]:
+                    continue
+                if field.annotation is str:
+                    values = archive[f"{name}.{column}.values"].astype(object)
+                    columns[column] = values[archive[f"{name}.{column}.codes"]]
+                else:
+                    columns[column] = archive[f"{name}.{column}"]
+            tables[name] = (pd.DataFrame(columns), str(archive[f"{name}.__source__"]))
+    return tables
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from twmap.snapshot.schema_check import COORDINATE_COLUMNS
+
+# Snapshot tables are held in a compact form: ids as int32, coordinates as int16 and other
+# integers as int32 where the values fit. Strings repeated across rows (village names,
+# "Barbarian village", ...) point at a single shared object per distinct value. The snapshot
+# datetime, world id and source file are per-table metadata in DataFrame.attrs instead of
+# string columns repeated on every row.
+
+
+def _downcast(values: pd.Series, dtype) -> pd.Series:
+    info = np.iinfo(dtype)
+    if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+        return values.astype(dtype)
+    return values
+
+
+def _shared_strings(values: pd.Series) -> pd.Series:
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return pd.Series(np.asarray(uniques, dtype=object)[codes], index=values.index, name=values.name)
+
+
+def compact_snapshot_table(df: pd.DataFrame, model: type[BaseModel]) -> pd.DataFrame:
+    """Convert a validated snapshot table to compact dtypes, in place.
+
+    Args:
+        df (pd.DataFrame): Table with the columns of the model.
+        model (type[BaseModel]): Data model of one row.
+
+    Returns:
+        pd.DataFrame: The compacted table.
+    """
+    for column, field in model.model_fields.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if field.annotation is int and pd.api.types.is_integer_dtype(values.dtype):
+            if column in COORDINATE_COLUMNS:
+                df[column] = _downcast(values, np.int16)
+            elif column != "timestamp":  # epoch seconds are compared with 64 bit timestamps
+                df[column] = _downcast(values, np.int32)
+        elif field.annotation is str and pd.api.types.is_object_dtype(values.dtype):
+            df[column] = _shared_strings(values)
+    return df
+
+
+def snapshot_metadata(file_path: str) -> dict:
+    """Get the metadata of a snapshot table from the key of its file.
+
+    e.g. en146/village_en146_20250930_221458.txt -> datetime 20250930_221458, world_id en146
+    """
+    filename = file_path.split("/")[-1]
+    return {
+        "datetime": "_".join(filename.split("_")[2:4]).replace(".txt", ""),
+        "world_id": filename.split("_")[1],
+        "file_path": file_path,
+    }
+
+
+def get_table_metadata(df: pd.DataFrame, key: str):
+    """Get a metadata value of a snapshot table, from DataFrame.attrs or else from its first row."""
+    if key in df.attrs:
+        return df.attrs[key]
+    return df[key].iloc[0]
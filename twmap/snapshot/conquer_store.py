@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+
+class ConquerStore:
+    """All conquers of a world, parsed once and kept sorted by timestamp.
+
+    conquer.txt is a single growing file per world that every snapshot points at, and a snapshot
+    only ever looks at a time window of it. Keeping the table sorted lets those windows be cut
+    with a binary search instead of scanning the whole history for every frame.
+    """
+
+    def __init__(self, conquer_df: pd.DataFrame):
+        """Wrap a conquer table, sorting it by timestamp if needed.
+
+        Args:
+            conquer_df (pd.DataFrame): Conquers with at least a timestamp column.
+        """
+        if not conquer_df.empty and not conquer_df["timestamp"].is_monotonic_increasing:
+            conquer_df = conquer_df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+        self.conquer_df = conquer_df
+        self.timestamps = conquer_df["timestamp"].to_numpy() if "timestamp" in conquer_df.columns else np.empty(0)
+
+    @property
+    def empty(self) -> bool:
+        return self.conquer_df.empty
+
+    def __len__(self) -> int:
+        return len(self.conquer_df)
+
+    def window(self, start: float, end: float) -> pd.DataFrame:
+        """Get the conquers with start < timestamp <= end.
+
+        Args:
+            start (float): Exclusive lower bound as epoch seconds.
+            end (float): Inclusive upper bound as epoch seconds.
+
+        Returns:
+            pd.DataFrame: Slice of the sorted conquer table.
+        """
+        left = np.searchsorted(self.timestamps, start, side="right")
+        right = np.searchsorted(self.timestamps, end, side="right")
+        return self.conquer_df.iloc[left:right]
@@ -1,20 +1,29 @@
 from twmap.snapshot.snapshot_datamodel import VillageModel, PlayerModel, TribeModel, ConquerModel
+from twmap.snapshot.conquer_store import ConquerStore
+from twmap.snapshot.group_index import GroupIndex
+from twmap.snapshot.compact import get_table_metadata
+import numpy as np
 import pandas as pd
 import logging
 
 
 class DataFilter:
     """Class to filter villages, players, tribes, and conquers based on various criteria for a single snapshot.
-    
+
+    Nothing is derived up front: every view (top 10 players, their villages, recent conquers,
+    the group indexes, ...) is computed the first time it is asked for and memoized, so a
+    renderer only pays for the views it draws.
     """
 
-    def __init__(self, village_df: pd.DataFrame, player_df: pd.DataFrame, tribe_df: pd.DataFrame, conquer_df: pd.DataFrame,
+    def __init__(self, village_df: pd.DataFrame, player_df: pd.DataFrame, tribe_df: pd.DataFrame, conquer_df,
                  killall_df: pd.DataFrame = None, killall_df_tribe: pd.DataFrame = None, killatt_df: pd.DataFrame = None, 
                  killdef_df: pd.DataFrame = None, killtribeatt_df: pd.DataFrame = None, killtribedef_df: pd.DataFrame = None):
         self.village_df = village_df
         self.player_df = player_df
         self.tribe_df = tribe_df
-        self.conquer_df = conquer_df
+        # Conquers are either the world's shared ConquerStore or a plain DataFrame
+        self.conquer_store = conquer_df if isinstance(conquer_df, ConquerStore) else ConquerStore(conquer_df)
+        self.conquer_df = self.conquer_store.conquer_df
         self.killall_df = killall_df
         self.killall_df_tribe = killall_df_tribe
         self.killatt_df = killatt_df
@@ -22,15 +31,68 @@ class DataFilter:
         self.killtribeatt_df = killtribeatt_df
         self.killtribedef_df = killtribedef_df
         
-        self.printed_timestamp = pd.to_datetime(village_df["datetime"][0], format="%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
-        self.world_id = village_df.iloc[0]["world_id"]
+        self.printed_timestamp = pd.to_datetime(get_table_metadata(village_df, "datetime"), format="%Y%m%d_%H%M%S").strftime("%Y-%m-%d %H:%M:%S")
+        self.world_id = get_table_metadata(village_df, "world_id")
+        self.snapshot_timestamp = int(pd.to_datetime(self.printed_timestamp).timestamp())
+
+        # Derived views are computed on first use and memoized, see invalidate()
+        self._cache = {}
+
+    def _memoized(self, name: str, compute):
+        """Get a derived view, computing it on first use."""
+        if name not in self._cache:
+            self._cache[name] = compute()
+        return self._cache[name]
+
+    def invalidate(self, *names: str) -> None:
+        """Drop memoized views, e.g. after modifying village_df, player_df or tribe_df in place.
+
+        Args:
+            *names (str): Views to drop, e.g. "t10_players". Drops every view when none are given.
+        """
+        if not names:
+            self._cache.clear()
+        for name in names:
+            self._cache.pop(name, None)
+
+    @property
+    def village_tribeids(self) -> np.ndarray:
+        """Tribe of the owner of every village, -1 when the owner is unknown (barbarians)."""
+        return self._memoized("village_tribeids", self.get_village_tribeids)
 
-        self.joined_player_villages = pd.merge(self.village_df, self.player_df, on="playerid")
+    @property
+    def villages_by_player(self) -> GroupIndex:
+        """Villages grouped by playerid, so the villages of a set of players are a gather instead of a scan."""
+        return self._memoized("villages_by_player", lambda: GroupIndex(self.village_df["playerid"].to_numpy()))
 
-        # Cache variables
-        self._past_day_conquers = None
-        self._t10_players = None
-        self._t10_tribes = None
+    @property
+    def villages_by_tribe(self) -> GroupIndex:
+        """Villages grouped by the tribeid of their owner."""
+        return self._memoized("villages_by_tribe", lambda: GroupIndex(self.village_tribeids))
+
+    def get_village_tribeids(self) -> np.ndarray:
+        """Get the tribe of the owner of every village, in village_df order.
+
+        Returns:
+            np.ndarray: tribeid per village, -1 for villages whose owner is not in player_df.
+        """
+        player_tribes = self.player_df.drop_duplicates("playerid").set_index("playerid")["tribeid"]
+        return self.village_df["playerid"].map(player_tribes).fillna(-1).to_numpy(dtype=np.int64)
+
+    def villages_at(self, positions: np.ndarray, with_tribeid: bool = False) -> pd.DataFrame:
+        """Gather villages by row position, with a fresh index.
+
+        Args:
+            positions (np.ndarray): Row positions in village_df.
+            with_tribeid (bool, optional): Add the tribeid of the owner as a column. Defaults to False.
+
+        Returns:
+            pd.DataFrame: The gathered villages.
+        """
+        villages = self.village_df.iloc[positions].reset_index(drop=True)
+        if with_tribeid:
+            villages["tribeid"] = self.village_tribeids[positions].astype(self.player_df["tribeid"].dtype)
+        return villages
 
     def get_past_day_conquers(self):
         """Get conquers from the past three days. Uses the epoch timestamp to filter. Return filter on village df
@@ -38,20 +100,18 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing conquers from the past three days.
         """
-        if self._past_day_conquers is None:
-            if self.conquer_df.empty:
-                logging.info("No conquers found in the dataset.")
-                return pd.DataFrame()
-            past_three_days = pd.to_datetime(self.printed_timestamp).timestamp() - (86400 * 3)  # 3 days in seconds
-            past_day_conquers = self.conquer_df[
-                (self.conquer_df["timestamp"] > past_three_days) & 
-                (self.conquer_df["timestamp"] <= pd.to_datetime(self.printed_timestamp).timestamp())
-            ]
-            if past_day_conquers.empty:
-                logging.info("No conquers found in the past three days.")
-                return pd.DataFrame()
-            self._past_day_conquers = self.village_df[self.village_df["villageid"].isin(past_day_conquers["villageid"])]
-        return self._past_day_conquers
+        return self._memoized("past_day_conquers", self._compute_past_day_conquers)
+
+    def _compute_past_day_conquers(self):
+        if self.conquer_store.empty:
+            logging.info("No conquers found in the dataset.")
+            return pd.DataFrame()
+        past_three_days = self.snapshot_timestamp - (86400 * 3)  # 3 days in seconds
+        past_day_conquers = self.conquer_store.window(past_three_days, self.snapshot_timestamp)
+        if past_day_conquers.empty:
+            logging.info("No conquers found in the past three days.")
+            return pd.DataFrame()
+        return self.village_df[self.village_df["villageid"].isin(past_day_conquers["villageid"])]
 
     def get_past_day_t10_conquers_players(self):
         """Get conquers from the past day of top 10 players. Uses the epoch timestamp to filter. Return filter on village df
@@ -59,12 +119,14 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing conquers from the past day of top 10 players.
         """
+        return self._memoized("past_day_t10_conquers_players", self._compute_past_day_t10_conquers_players)
+
+    def _compute_past_day_t10_conquers_players(self):
         past_day_conquers = self.get_past_day_conquers()
         if past_day_conquers.empty:
             logging.info("No conquers found in the past day for top 10 players.")
             return pd.DataFrame()
-        t10_players = self.get_t10_players()
-        t10_player_villages = pd.concat([self.filter_villages_player(player_id) for player_id in t10_players["playerid"]], ignore_index=True)
+        t10_player_villages = self.get_t10_player_villages()
         result = t10_player_villages[t10_player_villages["villageid"].isin(past_day_conquers["villageid"])]
         if result.empty:
             logging.info("No conquers found in the past day for villages of top 10 players.")
@@ -76,13 +138,14 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing conquers from the past day of top 10 tribes.
         """
+        return self._memoized("past_day_t10_conquers_tribes", self._compute_past_day_t10_conquers_tribes)
+
+    def _compute_past_day_t10_conquers_tribes(self):
         past_day_conquers = self.get_past_day_conquers()
         if past_day_conquers.empty:
             logging.info("No conquers found in the past day for top 10 tribes.")
             return pd.DataFrame()
-        t10_tribes = self.get_t10_tribes()
-        t10_tribe_villages = pd.concat([self.filter_villages_tribe(tribeid) for tribeid in t10_tribes["tribeid"]], ignore_index=True)
-        t10_tribe_villages = t10_tribe_villages.merge(self.player_df[['playerid', 'tribeid']], on='playerid', how='left')
+        t10_tribe_villages = self.get_t10_tribe_villages()
         result = t10_tribe_villages[t10_tribe_villages["villageid"].isin(past_day_conquers["villageid"])]
         if result.empty:
             logging.info("No conquers found in the past day for villages of top 10 tribes.")
@@ -94,9 +157,7 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing top 10 players by points.
         """
-        if self._t10_players is None:
-            self._t10_players = self.player_df.nlargest(10, "points")
-        return self._t10_players
+        return self._memoized("t10_players", lambda: self.player_df.nlargest(10, "points"))
     
     def get_t10_tribes(self):
         """Get top 10 tribes by points.
@@ -104,9 +165,7 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing top 10 tribes by points.
         """
-        if self._t10_tribes is None:
-            self._t10_tribes = self.tribe_df.nlargest(10, "tribe_points")
-        return self._t10_tribes
+        return self._memoized("t10_tribes", lambda: self.tribe_df.nlargest(10, "tribe_points"))
 
     def filter_villages_player(self, player_id: int):
         """Filter villages by player id.
@@ -117,14 +176,12 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing villages of the specified player.
         """
-        return self.village_df[self.village_df["playerid"] == player_id]
+        return self.village_df.iloc[self.villages_by_player.positions(player_id)]
     
     def filter_villages_tribe(self, tribe_id: int):
-        """Filter villages by tribe id, first get all players in tribe then filter villages by player ids
+        """Filter villages by tribe id, i.e. the villages of all players in the tribe
         """
-        players_in_tribe = self.player_df[self.player_df["tribeid"] == tribe_id]
-        player_ids = players_in_tribe["playerid"]
-        return self.village_df[self.village_df["playerid"].isin(player_ids)]
+        return self.village_df.iloc[self.villages_by_tribe.positions(tribe_id)]
     
     def get_t10_player_villages(self):
         """Get top 10 players by points and return a single DataFrame of villages
@@ -132,9 +189,10 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing villages of top 10 players
         """
-        t10_players = self.get_t10_players()
-        t10_player_villages = [self.filter_villages_player(player_id) for player_id in t10_players["playerid"]]
-        return pd.concat(t10_player_villages, ignore_index=True)
+        return self._memoized(
+            "t10_player_villages",
+            lambda: self.villages_at(self.villages_by_player.positions(self.get_t10_players()["playerid"].to_numpy())),
+        )
     
     def get_t10_tribe_villages(self):
         """Get top 10 tribes by points and return df of villages with tribeid included
@@ -142,11 +200,10 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing villages of top 10 tribes with tribeid included
         """
-        t10_tribes = self.get_t10_tribes()
-        t10_tribe_villages = [self.filter_villages_tribe(tribe_id) for tribe_id in t10_tribes["tribeid"]]
-        result_df = pd.concat(t10_tribe_villages, ignore_index=True)
-        result_df = result_df.merge(self.player_df[['playerid', 'tribeid']], on='playerid', how='left')        
-        return result_df
+        return self._memoized(
+            "t10_tribe_villages",
+            lambda: self.villages_at(self.villages_by_tribe.positions(self.get_t10_tribes()["tribeid"].to_numpy()), with_tribeid=True),
+        )
 
     def filter_players(self, player_ids: list):
         """Filter players by list of player ids.
@@ -202,7 +259,7 @@ class DataFilter:
             pd.DataFrame: DataFrame containing villages of the specified player names.
         """
         player_df = self.filter_by_player_names(player_names)
-        return self.village_df[self.village_df["playerid"].isin(player_df["playerid"])]
+        return self.village_df.iloc[self.villages_by_player.positions(player_df["playerid"].to_numpy(), sort=True)]
     
     def filter_villages_by_tribe_tags(self, tribe_tags: list):
         """Filter villages by list of tribe tags.
@@ -214,9 +271,7 @@ class DataFilter:
             pd.DataFrame: DataFrame containing villages of the specified tribe tags with tribeid included.
         """
         tribe_df = self.filter_by_tribe_tags(tribe_tags)
-        players_in_tribes = self.player_df[self.player_df["tribeid"].isin(tribe_df["tribeid"])]
-        villages = self.village_df[self.village_df["playerid"].isin(players_in_tribes["playerid"])]
-        return villages.merge(players_in_tribes[['playerid', 'tribeid']], on='playerid', how='left')
+        return self.villages_at(self.villages_by_tribe.positions(tribe_df["tribeid"].to_numpy(), sort=True), with_tribeid=True)
     
     def filter_villages_by_tribe_ids(self, tribe_ids: list):
         """Filter villages by list of tribe ids.
@@ -228,9 +283,7 @@ class DataFilter:
             pd.DataFrame: DataFrame containing villages of the specified tribe ids with tribeid included.
         """
         tribe_df = self.filter_tribes(tribe_ids)
-        players_in_tribes = self.player_df[self.player_df["tribeid"].isin(tribe_df["tribeid"])]
-        villages = self.village_df[self.village_df["playerid"].isin(players_in_tribes["playerid"])]
-        return villages.merge(players_in_tribes[['playerid', 'tribeid']], on='playerid', how='left')
+        return self.villages_at(self.villages_by_tribe.positions(tribe_df["tribeid"].to_numpy(), sort=True), with_tribeid=True)
     
     def get_past_day_conquers_by_tribe_ids(self, tribe_ids: list):
         """Get conquers from the past day of tribes specified by ids. Uses the epoch timestamp to filter. Return filter on village df
@@ -354,25 +407,15 @@ class DataFilter:
             dict: "pairwise" DataFrame showing per tribe-pair gains and "totals"
                   DataFrame showing aggregate gains/losses per tribe.
         """
-        if self.conquer_df.empty:
+        if self.conquer_store.empty:
             logging.info("No conquer data available to summarize wars.")
             return {"pairwise": pd.DataFrame(), "totals": pd.DataFrame()}
 
-        data_pull_datetime = self.conquer_df["datetime"]
-        if data_pull_datetime.empty:
-            logging.info("No conquer timestamps available.")
-            return {"pairwise": pd.DataFrame(), "totals": pd.DataFrame()}
-
-        data_pull_datetime = pd.to_datetime(data_pull_datetime, format="%Y%m%d_%H%M%S")
-        data_pull_datetime = data_pull_datetime.astype(int) // 10**9
-        window_end = data_pull_datetime.iloc[0]
+        window_end = self.snapshot_timestamp
         window_seconds = max(window_days, 1) * 86400
         window_start = window_end - window_seconds
 
-        recent_conquers = self.conquer_df[
-            (self.conquer_df["timestamp"] > window_start) &
-            (self.conquer_df["timestamp"] <= window_end)
-        ].copy()
+        recent_conquers = self.conquer_store.window(window_start, window_end).copy()
 
         if recent_conquers.empty:
             logging.info("No conquers found in the requested window for war overview.")
@@ -466,18 +509,11 @@ class DataFilter:
         Returns:
             pd.DataFrame: DataFrame containing conquers from the past month.
         """
-        data_pull_datetime = self.conquer_df["datetime"]
-        if data_pull_datetime.empty:
+        if self.conquer_store.empty:
             logging.info("No conquers found in the dataset.")
             return pd.DataFrame()
-        data_pull_datetime = pd.to_datetime(data_pull_datetime, format="%Y%m%d_%H%M%S")
-        data_pull_datetime = data_pull_datetime.astype(int) // 10**9
-        data_pull_datetime = data_pull_datetime.iloc[0]
-        past_month = data_pull_datetime - (86400 * 30)
-        past_month_conquers = self.conquer_df[
-            (self.conquer_df["timestamp"] > past_month) & 
-            (self.conquer_df["timestamp"] <= data_pull_datetime)
-        ]
+        past_month = self.snapshot_timestamp - (86400 * 30)
+        past_month_conquers = self.conquer_store.window(past_month, self.snapshot_timestamp)
         if past_month_conquers.empty:
             logging.info("No conquers found in the past month.")
             return pd.DataFrame()
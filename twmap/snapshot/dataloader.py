@@ -1,28 +1,73 @@
 import pandas as pd
-from pandantic import Pandantic
 from pydantic import ValidationError
 
 import boto3 
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, NamedTuple, Optional
 
-from io import StringIO
+from io import BytesIO, StringIO
 
 from twmap.snapshot.snapshot_datamodel import VillageModel, PlayerModel, TribeModel, ConquerModel, KillAllModel, KillTribeModel, KillAttModel, KillDefModel, KillTribeAttModel, KillTribeDefModel
-from twmap.world.world_datamodel import WorldModel
+from twmap.world.world_datamodel import WorldModel, SnapshotFileModel
 from twmap.world.world_loader import WorldLoader
+from twmap.snapshot.snapshot_cache import SnapshotCache
+from twmap.snapshot.conquer_store import ConquerStore
+from twmap.snapshot.schema_check import SnapshotSchemaValidator
+from twmap.snapshot.columnar import COLUMNAR_TABLES, columnar_key_for_village, encode_snapshot_tables, decode_snapshot_tables
+from twmap.snapshot.compact import compact_snapshot_table, snapshot_metadata
+from twmap.snapshot.requirement import DataRequirement, ALL_TABLES, project_model
+from twmap.snapshot.datafilter import DataFilter
 
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+class SnapshotBundle(NamedTuple):
+    """The tables of one snapshot, as yielded by DataLoader.iter_snapshots."""
+    snapshot: SnapshotFileModel
+    tribe_df: pd.DataFrame
+    player_df: pd.DataFrame
+    village_df: pd.DataFrame
+    conquer_store: ConquerStore
+    killall_df: Optional[pd.DataFrame] = None
+    killall_tribe_df: Optional[pd.DataFrame] = None
+    killatt_df: Optional[pd.DataFrame] = None
+    killdef_df: Optional[pd.DataFrame] = None
+    killtribeatt_df: Optional[pd.DataFrame] = None
+    killtribedef_df: Optional[pd.DataFrame] = None
+
+    def data_filter(self) -> DataFilter:
+        """Create a DataFilter over the tables of the snapshot."""
+        return DataFilter(
+            self.village_df, self.player_df, self.tribe_df, self.conquer_store, self.killall_df, self.killall_tribe_df,
+            self.killatt_df, self.killdef_df, self.killtribeatt_df, self.killtribedef_df,
+        )
+
+
 class DataLoader:
     """Loads a snapshot from S3 into memory as pandas dataframes
     """
 
-    def __init__(self, world_loader: WorldLoader = None):
+    def __init__(self, world_loader: WorldLoader = None, snapshot_cache: SnapshotCache = None,
+                 strict_validation: bool = False, validation_sample_size: int = 100, max_fetch_workers: int = 10):
+        """Create a loader for the snapshots of a world.
+
+        Args:
+            world_loader (WorldLoader, optional): World whose snapshot bucket is read. Defaults to None.
+            snapshot_cache (SnapshotCache, optional): Local cache in front of S3. Defaults to None (always download).
+            strict_validation (bool, optional): Validate every row with Pandantic instead of the vectorized check. Defaults to False.
+            validation_sample_size (int, optional): Rows per table validated with Pandantic when not strict. Defaults to 100.
+            max_fetch_workers (int, optional): Files of a snapshot fetched and parsed concurrently. Defaults to 10.
+        """
         
         self.world_loader = world_loader
+        self.snapshot_cache = snapshot_cache
+        self.schema_validator = SnapshotSchemaValidator(strict=strict_validation, sample_size=validation_sample_size)
 
         self.village_models = []
         self.player_models = []
@@ -35,17 +80,116 @@ class DataLoader:
         self.killtribeatt_models = []
         self.killtribedef_models = []
 
+        # conquer.txt is shared by every snapshot of a world, so it is parsed once per path
+        self.conquer_stores = {}
+        self._conquer_lock = threading.Lock()
+
         self.s3_client = boto3.client("s3")
+        # The files of a snapshot are fetched in parallel, the client is shared between the threads
+        self.fetch_executor = ThreadPoolExecutor(max_workers=max_fetch_workers, thread_name_prefix="snapshot-fetch")
         
         self.t10_tribes_list = []
         self.t10_players_list = []
         self.max_coords = 0
-        
-    def retrieve_from_s3(self, file_path: str):
+
+    def close(self) -> None:
+        """Shut down the fetch threads, waiting for fetches in progress. The loader cannot load afterwards."""
+        self.fetch_executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def retrieve_bytes_from_s3(self, file_path: str) -> bytes:
         # Use the snapshot bucket from world_loader for data files
         bucket = self.world_loader.s3_snapshot_bucket
+        if self.snapshot_cache is not None:
+            return self.snapshot_cache.get(self.s3_client, bucket, file_path)
         response = self.s3_client.get_object(Bucket=bucket, Key=file_path)
-        return response["Body"].read().decode("utf-8")
+        return response["Body"].read()
+
+    def retrieve_from_s3(self, file_path: str):
+        return self.retrieve_bytes_from_s3(file_path).decode("utf-8")
+
+    def add_file_metadata(self, df: pd.DataFrame, file_path: str, model) -> pd.DataFrame:
+        """Compact a validated table and attach the datetime, world_id and file_path of its file as DataFrame.attrs."""
+        df = compact_snapshot_table(df, model)
+        df.attrs.update(snapshot_metadata(file_path))
+        return df
+
+    @staticmethod
+    def fill_missing_strings(df: pd.DataFrame, model) -> pd.DataFrame:
+        """Replace missing values of the str columns with empty strings.
+
+        Only str columns are filled, filling int columns would turn them into object columns.
+        """
+        string_columns = [column for column, field in model.model_fields.items() if field.annotation is str]
+        if string_columns:
+            df[string_columns] = df[string_columns].fillna("")
+        return df
+
+    @staticmethod
+    def read_csv_table(content, model, columns: tuple = None) -> pd.DataFrame:
+        """Parse the CSV contents of a snapshot file.
+
+        Bytes are parsed in place through a BytesIO, which shares the buffer, so the file is never
+        decoded into a separate Python str. The str fields of the model are always read as strings,
+        names stay URL-encoded until they are drawn.
+
+        Args:
+            content (bytes | str): Contents of the file.
+            model (type[BaseModel]): Data model of one row of the file.
+            columns (tuple, optional): Columns to keep, the others are skipped without being converted. Defaults to None (all).
+
+        Returns:
+            pd.DataFrame: The parsed table, not yet validated.
+        """
+        buffer = BytesIO(content) if isinstance(content, (bytes, bytearray, memoryview)) else StringIO(content)
+        string_columns = {
+            column: str for column, field in model.model_fields.items()
+            if field.annotation is str and (columns is None or column in columns)
+        }
+        return pd.read_csv(buffer, sep=",", header=None, names=list(model.model_fields.keys()), index_col=False,
+                           usecols=list(columns) if columns is not None else None, dtype=string_columns or None, encoding="utf-8")
+
+    def parse_snapshot_table(self, content, file_path: str, model, columns: tuple = None) -> pd.DataFrame:
+        """Parse and validate the contents of one snapshot .txt file.
+
+        Args:
+            content (bytes | str): Contents of the file.
+            file_path (str): S3 key of the file.
+            model (type[BaseModel]): Data model of one row of the file.
+            columns (tuple, optional): Columns to keep, in the field order of the model. Defaults to None (all).
+
+        Returns:
+            pd.DataFrame: The validated, compacted table with its datetime, world_id and file_path attrs.
+        """
+        df = self.read_csv_table(content, model, columns)
+        if columns is not None:
+            model = project_model(model, tuple(columns))
+        df = self.fill_missing_strings(df, model)
+        try:
+            df = self.schema_validator.validate(df, model)
+        except Exception as e:
+            logging.error(f"Error validating {model.__name__} data from {file_path}: {e}")
+            raise e
+        return self.add_file_metadata(df, file_path, model)
+
+    def read_snapshot_table(self, file_path: str, model, columns: tuple = None) -> pd.DataFrame:
+        """Download, parse and validate one snapshot .txt file.
+
+        Args:
+            file_path (str): S3 key of the file.
+            model (type[BaseModel]): Data model of one row of the file.
+            columns (tuple, optional): Columns to keep, in the field order of the model. Defaults to None (all).
+
+        Returns:
+            pd.DataFrame: The validated, compacted table with its datetime, world_id and file_path attrs.
+        """
+        return self.parse_snapshot_table(self.retrieve_bytes_from_s3(file_path), file_path, model, columns)
 
     def extract_s3_key(self, s3_path: str) -> str:
         if s3_path is None:
@@ -56,8 +200,266 @@ class DataLoader:
             return parts[3] if len(parts) > 3 else s3_path
         return s3_path
     
+    def load_conquer_store(self, conquer_path: str) -> ConquerStore:
+        """Load the conquer file of a world once and share it across all its snapshots.
+
+        Args:
+            conquer_path (str): S3 key of the world's conquer file, e.g. en146/conquer.txt.
+
+        Returns:
+            ConquerStore: All conquers of the world sorted by timestamp.
+        """
+        if conquer_path is None:
+            return ConquerStore(pd.DataFrame(columns=ConquerModel.model_fields.keys()))
+
+        with self._conquer_lock:
+            conquer_store = self.conquer_stores.get(conquer_path)
+            if conquer_store is None:
+                content = self.retrieve_bytes_from_s3(conquer_path)
+                if not content.isspace() and content:  # Check if file has content, without copying it
+                    conquer_df = self.read_csv_table(content, ConquerModel)
+                    conquer_df = self.schema_validator.validate(conquer_df, ConquerModel)
+                    conquer_df = compact_snapshot_table(conquer_df, ConquerModel)
+                else:
+                    # Empty dataframe with correct structure
+                    conquer_df = pd.DataFrame(columns=ConquerModel.model_fields.keys())
+                conquer_df.attrs.update({"world_id": conquer_path.split("/")[0], "file_path": conquer_path})
+
+                conquer_store = ConquerStore(conquer_df)
+                self.conquer_stores[conquer_path] = conquer_store
+                logging.info(f"Loaded {len(conquer_store)} conquers from {conquer_path}")
+
+        return conquer_store
+
+    def load_columnar_files(self, columnar_path: str, requirement: DataRequirement = None) -> dict:
+        """Load the tables of one snapshot from its columnar file.
+
+        Args:
+            columnar_path (str): S3 key of the columnar snapshot file.
+            requirement (DataRequirement, optional): Tables and columns to decode. Defaults to None (all).
+
+        Returns:
+            dict: table name (see COLUMNAR_TABLES) -> DataFrame, with the same columns as the .txt loaders.
+        """
+        return self.parse_columnar_file(self.retrieve_bytes_from_s3(columnar_path), requirement)
+
+    def parse_columnar_file(self, data: bytes, requirement: DataRequirement = None) -> dict:
+        """Decode the required tables and columns of a columnar snapshot file into DataFrames like the .txt loaders'."""
+        requirement = requirement or ALL_TABLES
+        tables = decode_snapshot_tables(data, requirement.tables)
+        return {name: self.add_file_metadata(df, source_path, requirement.model(name)) for name, (df, source_path) in tables.items()}
+
+    def fetch_snapshot_files(self, snapshot: SnapshotFileModel, requirement: DataRequirement = None) -> dict:
+        """Download the raw files of one snapshot concurrently, without parsing them.
+
+        The columnar file is preferred when the snapshot has one. The world's conquer store is
+        loaded here as well, so parsing the files needs no further requests.
+
+        Args:
+            snapshot (SnapshotFileModel): Snapshot to download.
+            requirement (DataRequirement, optional): Tables to download .txt files of. Defaults to None (all).
+
+        Returns:
+            dict: table name -> (S3 key, bytes), or {"columnar": (S3 key, bytes)} for a columnar file.
+        """
+        requirement = requirement or ALL_TABLES
+        self.load_conquer_store(self.extract_s3_key(snapshot.conquer_data_path))
+
+        if snapshot.columnar_data_path:
+            columnar_path = self.extract_s3_key(snapshot.columnar_data_path)
+            try:
+                return {"columnar": (columnar_path, self.retrieve_bytes_from_s3(columnar_path))}
+            except Exception as e:
+                logging.warning(f"Could not fetch columnar snapshot {columnar_path}, falling back to .txt files: {e}")
+
+        paths = {name: self.extract_s3_key(getattr(snapshot, attribute)) for name, (attribute, _) in COLUMNAR_TABLES.items() if name in requirement}
+        futures = {name: self.fetch_executor.submit(self.retrieve_bytes_from_s3, path) for name, path in paths.items() if path}
+        return {name: (paths[name], future.result()) for name, future in futures.items()}
+
+    def parse_snapshot_files(self, files: dict, conquer_path: str = None, requirement: DataRequirement = None) -> tuple:
+        """Parse files downloaded by fetch_snapshot_files.
+
+        Args:
+            files (dict): Output of fetch_snapshot_files.
+            conquer_path (str, optional): S3 key of the world's conquer file. Defaults to None.
+            requirement (DataRequirement, optional): Tables and columns to parse. Defaults to None (all).
+
+        Returns:
+            tuple: Same tables as load_specific_files.
+        """
+        requirement = requirement or ALL_TABLES
+        if "columnar" in files:
+            tables = self.parse_columnar_file(files["columnar"][1], requirement)
+        else:
+            tables = {
+                name: self.parse_snapshot_table(data, path, COLUMNAR_TABLES[name][1], requirement.columns(name))
+                for name, (path, data) in files.items() if name in requirement
+            }
+        return (
+            tables.get("ally"), tables.get("player"), tables.get("village"), self.load_conquer_store(conquer_path),
+            tables.get("killall"), tables.get("killall_tribe"), tables.get("killatt"), tables.get("killdef"),
+            tables.get("killtribeatt"), tables.get("killtribedef"),
+        )
+
+    def convert_snapshot_to_columnar(self, snapshot: SnapshotFileModel) -> str:
+        """Write the tables of one snapshot as a single columnar file next to the raw .txt dumps.
+
+        Args:
+            snapshot (SnapshotFileModel): Snapshot to convert, its columnar_data_path is updated.
+
+        Returns:
+            str: S3 key of the written columnar file.
+        """
+        paths = {name: self.extract_s3_key(getattr(snapshot, attribute)) for name, (attribute, _) in COLUMNAR_TABLES.items()}
+
+        tribe_df, player_df, village_df, _, killall_df, killall_tribe_df, killatt_df, killdef_df, killtribeatt_df, killtribedef_df = self.load_specific_files(
+            paths["ally"], paths["player"], paths["village"], None, paths["killall"], paths["killall_tribe"],
+            paths["killatt"], paths["killdef"], paths["killtribeatt"], paths["killtribedef"]
+        )
+        if village_df is None:
+            raise ValueError(f"Could not load snapshot files for {paths['village']}")
+
+        loaded = dict(zip(COLUMNAR_TABLES, (tribe_df, player_df, village_df, killall_df, killall_tribe_df, killatt_df, killdef_df, killtribeatt_df, killtribedef_df)))
+        body = encode_snapshot_tables({name: (df, paths[name]) for name, df in loaded.items()})
+
+        bucket = self.world_loader.s3_snapshot_bucket
+        columnar_key = columnar_key_for_village(paths["village"])
+        self.s3_client.put_object(Bucket=bucket, Key=columnar_key, Body=body)
+        snapshot.columnar_data_path = f"s3://{bucket}/{columnar_key}"
+        logging.info(f"Wrote columnar snapshot s3://{bucket}/{columnar_key} ({len(body)} bytes)")
+        return columnar_key
+
+    def convert_all_snapshots(self, overwrite: bool = False) -> int:
+        """Convert every snapshot of the world to the columnar format.
+
+        Args:
+            overwrite (bool, optional): Also rewrite snapshots that already have a columnar file. Defaults to False.
+
+        Returns:
+            int: Number of converted snapshots.
+        """
+        converted = 0
+        for snapshot in self.world_loader.snapshots:
+            if snapshot.columnar_data_path and not overwrite:
+                continue
+            try:
+                self.convert_snapshot_to_columnar(snapshot)
+                converted += 1
+            except Exception as e:
+                logging.error(f"Error converting snapshot {snapshot.timestamp} to columnar format: {e}")
+        logging.info(f"Converted {converted} snapshots of {self.world_loader.server}{self.world_loader.world} to columnar format")
+        return converted
+
+    def load_snapshot(self, snapshot: SnapshotFileModel, requirement: DataRequirement = None) -> tuple:
+        """Load the tables of one snapshot, see load_specific_files.
+
+        Args:
+            snapshot (SnapshotFileModel): Snapshot to load.
+            requirement (DataRequirement, optional): Tables and columns to load. Defaults to None (all).
+
+        Returns:
+            tuple: Same tables as load_specific_files.
+        """
+        return self.load_specific_files(
+            self.extract_s3_key(snapshot.tribe_data_path),
+            self.extract_s3_key(snapshot.player_data_path),
+            self.extract_s3_key(snapshot.village_data_path),
+            self.extract_s3_key(snapshot.conquer_data_path),
+            self.extract_s3_key(snapshot.killall_data_path),
+            self.extract_s3_key(snapshot.killall_tribe_data_path),
+            self.extract_s3_key(snapshot.killatt_data_path),
+            self.extract_s3_key(snapshot.killdef_data_path),
+            self.extract_s3_key(snapshot.killtribeatt_data_path),
+            self.extract_s3_key(snapshot.killtribedef_data_path),
+            columnar_path=self.extract_s3_key(snapshot.columnar_data_path),
+            requirement=requirement,
+        )
+
+    def select_snapshots(self, start=None, end=None, interval: int = 1, limit: int = None) -> list:
+        """Select snapshots of the world in timestamp order.
+
+        Args:
+            start (int | datetime, optional): First snapshot time to include, epoch seconds or datetime. Defaults to None.
+            end (int | datetime, optional): Last snapshot time to include, epoch seconds or datetime. Defaults to None.
+            interval (int, optional): Every Nth snapshot of the range starting from the first one, like the
+                interval of MapFactory.generate_missing_maps. Defaults to 1 (all).
+            limit (int, optional): Maximum number of snapshots. Defaults to None (no limit).
+
+        Returns:
+            list: The selected SnapshotFileModels.
+        """
+        if isinstance(start, datetime):
+            start = int(start.timestamp())
+        if isinstance(end, datetime):
+            end = int(end.timestamp())
+
+        snapshots = sorted(self.world_loader.snapshots, key=lambda snapshot: snapshot.timestamp)
+        snapshots = [
+            snapshot for snapshot in snapshots
+            if (start is None or snapshot.timestamp >= start) and (end is None or snapshot.timestamp <= end)
+        ]
+        snapshots = snapshots[::max(1, interval)]
+        return snapshots[:limit] if limit else snapshots
+
+    def iter_snapshots(self, start=None, end=None, interval: int = 1, limit: int = None, read_ahead: int = 2,
+                       requirement: DataRequirement = None) -> Iterator[SnapshotBundle]:
+        """Stream the snapshots of the world one at a time, in timestamp order.
+
+        The next read_ahead snapshots are loaded in the background while the consumer works on the
+        current one. The iterator keeps no reference to a bundle once it has been yielded, so it is
+        freed as soon as the consumer drops it and memory stays bounded by read_ahead + 1 snapshots
+        however long the history is. Snapshots that fail to load are logged and skipped. Closing the
+        iterator early cancels the loads that have not started.
+
+        Args:
+            start (int | datetime, optional): First snapshot time to include, epoch seconds or datetime. Defaults to None.
+            end (int | datetime, optional): Last snapshot time to include, epoch seconds or datetime. Defaults to None.
+            interval (int, optional): Every Nth snapshot of the range, see select_snapshots. Defaults to 1 (all).
+            limit (int, optional): Maximum number of snapshots. Defaults to None (no limit).
+            read_ahead (int, optional): Snapshots loaded ahead of the consumer, at least 1. Defaults to 2.
+            requirement (DataRequirement, optional): Tables and columns to load. Defaults to None (all).
+
+        Yields:
+            SnapshotBundle: The tables of one snapshot.
+        """
+        if read_ahead < 1:
+            raise ValueError(f"read_ahead must be at least 1, got {read_ahead}")
+
+        snapshots = iter(self.select_snapshots(start, end, interval, limit))
+        # Own threads, load_specific_files waits on the fetch executor and must not run inside it
+        executor = ThreadPoolExecutor(max_workers=read_ahead, thread_name_prefix="snapshot-read-ahead")
+        pending = deque()
+        try:
+            for snapshot in snapshots:
+                pending.append((snapshot, executor.submit(self.load_snapshot, snapshot, requirement)))
+                if len(pending) == read_ahead:
+                    break
+
+            while pending:
+                snapshot, future = pending.popleft()
+                next_snapshot = next(snapshots, None)
+                if next_snapshot is not None:
+                    pending.append((next_snapshot, executor.submit(self.load_snapshot, next_snapshot, requirement)))
+
+                # Neither the future nor a local keeps the tables alive while the generator is suspended
+                bundle = [SnapshotBundle(snapshot, *future.result())]
+                future = None
+                # The conquer store is loaded for every snapshot, it is only None when loading failed
+                if bundle[0].conquer_store is None:
+                    logging.warning(f"Skipping snapshot {snapshot.timestamp}, its files could not be loaded")
+                    continue
+                yield bundle.pop()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
     def load_all_files(self, limit: int = None):
         """Load all files from S3 into memory as pandas dataframes
+
+        Every snapshot is kept in the instance lists, so memory grows with the history of the
+        world. Prefer iter_snapshots, which streams one snapshot at a time.
+
         Args:
             limit (int, optional): Maximum number of snapshots to load. If None, loads all snapshots.
         Returns:
@@ -66,18 +468,7 @@ class DataLoader:
         snapshots = self.world_loader.snapshots[:limit] if limit else self.world_loader.snapshots
         
         for snapshot in snapshots:
-            tribe_model, player_model, village_model, conquer_model, killall_model, killall_tribe_model, killatt_model, killdef_model, killtribeatt_model, killtribedef_model = self.load_specific_files(
-                self.extract_s3_key(snapshot.tribe_data_path),
-                self.extract_s3_key(snapshot.player_data_path),
-                self.extract_s3_key(snapshot.village_data_path),
-                self.extract_s3_key(snapshot.conquer_data_path),
-                self.extract_s3_key(snapshot.killall_data_path),
-                self.extract_s3_key(snapshot.killall_tribe_data_path),
-                self.extract_s3_key(snapshot.killatt_data_path),
-                self.extract_s3_key(snapshot.killdef_data_path),
-                self.extract_s3_key(snapshot.killtribeatt_data_path),
-                self.extract_s3_key(snapshot.killtribedef_data_path)
-            )
+            tribe_model, player_model, village_model, conquer_model, killall_model, killall_tribe_model, killatt_model, killdef_model, killtribeatt_model, killtribedef_model = self.load_snapshot(snapshot)
 
             self.killall_models.append(killall_model)
             self.killall_tribe_models.append(killall_tribe_model)
@@ -93,9 +484,14 @@ class DataLoader:
         return self.tribe_models, self.player_models, self.village_models, self.conquer_models, self.killall_models, self.killall_tribe_models, self.killatt_models, self.killdef_models, self.killtribeatt_models, self.killtribedef_models
 
     def load_specific_files(self, ally_path: str, player_path: str, village_path: str, conquer_path: str, killall_path: str = None, 
-                            killall_tribe_path: str = None, killatt_path: str = None, killdef_path: str = None, killtribeatt_path: str = None, killtribedef_path: str = None):
+                            killall_tribe_path: str = None, killatt_path: str = None, killdef_path: str = None, killtribeatt_path: str = None, killtribedef_path: str = None,
+                            columnar_path: str = None, requirement: DataRequirement = None):
         """Load specific files for one snapshot
 
+        When the snapshot has a columnar file it is read instead of the .txt dumps, falling back
+        to the .txt files if it cannot be loaded. Only the tables and columns of the requirement
+        are downloaded and parsed.
+
         Args:
             ally_path (str): _description_
             player_path (str): _description_
@@ -107,154 +503,67 @@ class DataLoader:
             killdef_path (str, optional): _description_. Defaults to None.
             killtribeatt_path (str, optional): _description_. Defaults to None.
             killtribedef_path (str, optional): _description_. Defaults to None.
+            columnar_path (str, optional): Columnar file of the snapshot. Defaults to None.
+            requirement (DataRequirement, optional): Tables and columns to load. Defaults to None (all).
 
         Returns:
-            _type_: _description_
+            tuple: tribe, player and village DataFrames, the world's shared ConquerStore, then the
+                six kill DataFrames (None when no path was given or the table is not required).
         """
+        requirement = requirement or ALL_TABLES
 
-        try:
-            # Load tribe/ally data
-            content = self.retrieve_from_s3(ally_path)
-            tribe_df = pd.read_csv(StringIO(content), sep=",", header=None, names=TribeModel.model_fields.keys(), index_col=False)
-            # Handle NaN values by converting them to empty strings
-            tribe_df = tribe_df.fillna("")
-            tribe_schema = Pandantic(TribeModel)
-            tribe_model = tribe_schema.validate(tribe_df)
-            tribe_model["datetime"] = "_".join(ally_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-            tribe_model["world_id"] = ally_path.split("/")[-1].split("_")[1]
-            tribe_model["file_path"] = ally_path
-
-            # Load player data
-            content = self.retrieve_from_s3(player_path)
-            player_df = pd.read_csv(StringIO(content), sep=",", header=None, names=PlayerModel.model_fields.keys(), index_col=False)
-            # Handle NaN values by converting them to empty strings
-            player_df = player_df.fillna("")
-            player_schema = Pandantic(PlayerModel)
-            player_model = player_schema.validate(player_df)
-            player_model["datetime"] = "_".join(player_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-            player_model["world_id"] = player_path.split("/")[-1].split("_")[1]
-            player_model["file_path"] = player_path
-
-            # Load village data
-            content = self.retrieve_from_s3(village_path)
-            village_df = pd.read_csv(StringIO(content), sep=",", header=None, names=VillageModel.model_fields.keys(), index_col=False)
-            # Handle NaN values by converting them to empty strings
-            village_df = village_df.fillna("")
-            village_schema = Pandantic(VillageModel)
+        if columnar_path:
             try:
-                village_model = village_schema.validate(village_df)
+                tables = self.load_columnar_files(columnar_path, requirement)
+                return (
+                    tables.get("ally"), tables.get("player"), tables.get("village"), self.load_conquer_store(conquer_path),
+                    tables.get("killall"), tables.get("killall_tribe"), tables.get("killatt"), tables.get("killdef"),
+                    tables.get("killtribeatt"), tables.get("killtribedef"),
+                )
             except Exception as e:
-                logging.error(f"Error validating village data: {e}")
-                logging.error(f"Village data content: {content}")
-                logging.error(f"Village data path: {village_path}")
-                raise e
-            
-            village_model["datetime"] = "_".join(village_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-            village_model["world_id"] = village_path.split("/")[-1].split("_")[1]
-            village_model["file_path"] = village_path
-
-            # Load conquer data
-            content = self.retrieve_from_s3(conquer_path)
-            if content.strip():  # Check if file has content
-                conquer_df = pd.read_csv(StringIO(content), sep=",", header=None, names=ConquerModel.model_fields.keys(), index_col=False)
-                # Handle NaN values by converting them to empty strings
-                conquer_df = conquer_df.fillna("")
-                conquer_schema = Pandantic(ConquerModel)
-                conquer_model = conquer_schema.validate(conquer_df)
-                # since the conquer file is always named conquer.txt, we extract datetime from village path
-                conquer_model["datetime"] = "_".join(village_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                conquer_model["world_id"] = village_path.split("/")[-1].split("_")[1]
-                conquer_model["file_path"] = conquer_path
-            else:
-                # Return empty dataframe with correct structure
-                conquer_model = pd.DataFrame(columns=ConquerModel.model_fields.keys())
-                conquer_model["datetime"] = "_".join(conquer_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                conquer_model["world_id"] = conquer_path.split("/")[-1].split("_")[1]
-                conquer_model["file_path"] = conquer_path
-
-            # Load killall data if provided
-            if killall_path:
-                content = self.retrieve_from_s3(killall_path)
-                
-                killall_df = pd.read_csv(StringIO(content), sep=",", header=None, names=KillAllModel.model_fields.keys(), index_col=False)
-                # Handle NaN values by converting them to empty strings
-                killall_df = killall_df.fillna("")
-                killall_schema = Pandantic(KillAllModel)
-                killall_model = killall_schema.validate(killall_df)
-                killall_model["datetime"] = "_".join(killall_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                killall_model["world_id"] = killall_path.split("/")[-1].split("_")[1]
-                killall_model["file_path"] = killall_path
-            
-            if killall_tribe_path:
-                content = self.retrieve_from_s3(killall_tribe_path)
-
-                killall_tribe_df = pd.read_csv(StringIO(content), sep=",", header=None, names=KillTribeModel.model_fields.keys(), index_col=False)
-                # Handle NaN values by converting them to empty strings
-                killall_tribe_df = killall_tribe_df.fillna("")
-                killall_tribe_schema = Pandantic(KillTribeModel)
-                killall_tribe_model = killall_tribe_schema.validate(killall_tribe_df)
-                killall_tribe_model["datetime"] = "_".join(killall_tribe_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                killall_tribe_model["world_id"] = killall_tribe_path.split("/")[-1].split("_")[1]
-                killall_tribe_model["file_path"] = killall_tribe_path
-
-            if killatt_path:
-                content = self.retrieve_from_s3(killatt_path)
-
-                killatt_df = pd.read_csv(StringIO(content), sep=",", header=None, names=KillAttModel.model_fields.keys(), index_col=False)
-                # Handle NaN values by converting them to empty strings
-                killatt_df = killatt_df.fillna("")
-                killatt_schema = Pandantic(KillAttModel)
-                killatt_model = killatt_schema.validate(killatt_df)
-                killatt_model["datetime"] = "_".join(killatt_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                killatt_model["world_id"] = killatt_path.split("/")[-1].split("_")[1]
-                killatt_model["file_path"] = killatt_path
-            
-            if killdef_path:
-                content = self.retrieve_from_s3(killdef_path)
-
-                killdef_df = pd.read_csv(StringIO(content), sep=",", header=None, names=KillDefModel.model_fields.keys(), index_col=False)
-                # Handle NaN values by converting them to empty strings
-                killdef_df = killdef_df.fillna("")
-                killdef_schema = Pandantic(KillDefModel)
-                killdef_model = killdef_schema.validate(killdef_df)
-                killdef_model["datetime"] = "_".join(killdef_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                killdef_model["world_id"] = killdef_path.split("/")[-1].split("_")[1]
-                killdef_model["file_path"] = killdef_path
-            
-            if killtribeatt_path:
-                content = self.retrieve_from_s3(killtribeatt_path)
-
-                killtribeatt_df = pd.read_csv(StringIO(content), sep=",", header=None, names=KillTribeAttModel.model_fields.keys(), index_col=False)
-                # Handle NaN values by converting them to empty strings
-                killtribeatt_df = killtribeatt_df.fillna("")
-                killtribeatt_schema = Pandantic(KillTribeAttModel)
-                killtribeatt_model = killtribeatt_schema.validate(killtribeatt_df)
-                killtribeatt_model["datetime"] = "_".join(killtribeatt_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                killtribeatt_model["world_id"] = killtribeatt_path.split("/")[-1].split("_")[1]
-                killtribeatt_model["file_path"] = killtribeatt_path
-            
-            if killtribedef_path:
-                content = self.retrieve_from_s3(killtribedef_path)
-
-                killtribedef_df = pd.read_csv(StringIO(content), sep=",", header=None, names=KillTribeDefModel.model_fields.keys(), index_col=False)
-                # Handle NaN values by converting them to empty strings
-                killtribedef_df = killtribedef_df.fillna("")
-                killtribedef_schema = Pandantic(KillTribeDefModel)
-                killtribedef_model = killtribedef_schema.validate(killtribedef_df)
-                killtribedef_model["datetime"] = "_".join(killtribedef_path.split("/")[-1].split("_")[2:4]).replace(".txt", "")
-                killtribedef_model["world_id"] = killtribedef_path.split("/")[-1].split("_")[1]
-                killtribedef_model["file_path"] = killtribedef_path
+                logging.warning(f"Could not load columnar snapshot {columnar_path}, falling back to .txt files: {e}")
+
+        # Issue all GETs at once, each table is parsed as soon as its file has arrived
+        tables = {
+            "ally": (ally_path, TribeModel),
+            "player": (player_path, PlayerModel),
+            "village": (village_path, VillageModel),
+            "killall": (killall_path, KillAllModel),
+            "killall_tribe": (killall_tribe_path, KillTribeModel),
+            "killatt": (killatt_path, KillAttModel),
+            "killdef": (killdef_path, KillDefModel),
+            "killtribeatt": (killtribeatt_path, KillTribeAttModel),
+            "killtribedef": (killtribedef_path, KillTribeDefModel),
+        }
+        futures = {
+            name: self.fetch_executor.submit(self.read_snapshot_table, path, model, requirement.columns(name))
+            for name, (path, model) in tables.items() if path and name in requirement
+        }
+        # Load conquer data, parsed once per world and shared between snapshots
+        conquer_future = self.fetch_executor.submit(self.load_conquer_store, conquer_path)
+
+        try:
+            tribe_model = futures["ally"].result() if "ally" in requirement else None
+            player_model = futures["player"].result() if "player" in requirement else None
+            village_model = futures["village"].result() if "village" in requirement else None
+            conquer_model = conquer_future.result()
+
+            # Kill data is optional
+            killall_model = futures["killall"].result() if "killall" in futures else None
+            killall_tribe_model = futures["killall_tribe"].result() if "killall_tribe" in futures else None
+            killatt_model = futures["killatt"].result() if "killatt" in futures else None
+            killdef_model = futures["killdef"].result() if "killdef" in futures else None
+            killtribeatt_model = futures["killtribeatt"].result() if "killtribeatt" in futures else None
+            killtribedef_model = futures["killtribedef"].result() if "killtribedef" in futures else None
 
         except (ValidationError, Exception) as e:
-            logging.error(f"Error loading data files: {e}")
-            #print stack trace
-            print(conquer_path + "\n\n\n\n")
-            import traceback
-            traceback.print_exc()
+            for future in futures.values():
+                future.cancel()
+            logging.exception(f"Error loading data files for {conquer_path}: {e}")
             # exit(1)
-            return None, None, None, None, None, None
+            return None, None, None, None, None, None, None, None, None, None
 
-        return tribe_model, player_model, village_model, conquer_model, killall_model if killall_path else None, killall_tribe_model if killall_tribe_path else None, killatt_model if killatt_path else None, killdef_model if killdef_path else None, killtribeatt_model if killtribeatt_path else None, killtribedef_model if killtribedef_path else None
+        return tribe_model, player_model, village_model, conquer_model, killall_model, killall_tribe_model, killatt_model, killdef_model, killtribeatt_model, killtribedef_model
 
 if __name__ == "__main__":
     loader = DataLoader("s3://tribalwars-scraped/", "en142")
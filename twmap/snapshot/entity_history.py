@@ -0,0 +1,240 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from twmap.snapshot.history_store import HistoryStore
+from twmap.snapshot.ownership_history import history_root
+from twmap.snapshot.requirement import DataRequirement
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class EntityHistory(HistoryStore):
+    """Points, village count and rank of every player (or tribe) of a world in every snapshot.
+
+    Each metric is a memory-mapped matrix of snapshot index x entity column, one row per
+    snapshot in timestamp order. Entities get a column the first time they appear, the ids of
+    the columns are kept in an append-only file next to the matrices. Entities that do not
+    exist in a snapshot hold MISSING. Looking up the values of a snapshot is a row read and the
+    series of a set of entities over a time range is a block of rows, no snapshot is reloaded.
+    """
+
+    METRICS = ("points", "villages", "rank")
+    MATRICES = METRICS
+    # New players appear in almost every snapshot, so widen in large steps
+    GROWTH = 1.5
+
+    def __init__(self, directory: str, dtype=None):
+        """Open (or create) the history stored in a directory.
+
+        Args:
+            directory (str): Directory of the history of one kind of entity.
+            dtype (np.dtype, optional): Integer type of the cells, int64 when points may exceed int32. Defaults to int32.
+        """
+        self.ids_path = os.path.join(directory, "ids.i64")
+        self.entities = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self._columns = {}
+        super().__init__(directory, dtype)
+
+    def _read_meta(self, meta: dict) -> None:
+        self.entities = meta["entities"]
+        # The ids file may hold ids of an interrupted append beyond the counted entities
+        self.ids = np.fromfile(self.ids_path, dtype="<i8", count=self.entities).astype(np.int64)
+        self._columns = {int(entity_id): column for column, entity_id in enumerate(self.ids)}
+
+    def _write_meta(self) -> dict:
+        return {"entities": self.entities}
+
+    def columns(self, ids) -> np.ndarray:
+        """Column of every id, -1 for ids that never appeared."""
+        return np.array([self._columns.get(int(entity_id), -1) for entity_id in np.atleast_1d(ids)], dtype=np.intp)
+
+    def _add_entities(self, ids: np.ndarray) -> None:
+        new_ids = [int(entity_id) for entity_id in pd.unique(ids) if int(entity_id) not in self._columns]
+        if not new_ids:
+            return
+        with open(self.ids_path, "r+b" if os.path.exists(self.ids_path) else "wb") as ids_file:
+            ids_file.seek(self.entities * 8)
+            ids_file.truncate()
+            ids_file.write(np.asarray(new_ids, dtype="<i8").tobytes())
+        for entity_id in new_ids:
+            self._columns[entity_id] = len(self._columns)
+        self.ids = np.append(self.ids, np.asarray(new_ids, dtype=np.int64))
+        self.entities = len(self.ids)
+
+    def append(self, timestamp: int, ids: np.ndarray, points: np.ndarray, villages: np.ndarray, ranks: np.ndarray) -> None:
+        """Append the entities of one snapshot.
+
+        Args:
+            timestamp (int): Snapshot time in epoch seconds, after the last stored snapshot.
+            ids (np.ndarray): Playerid or tribeid of every entity of the snapshot.
+            points (np.ndarray): Points per entity.
+            villages (np.ndarray): Number of villages per entity.
+            ranks (np.ndarray): Rank per entity.
+
+        Raises:
+            ValueError: When the snapshot is not newer than the last stored one.
+        """
+        if len(self) and timestamp <= self.timestamps[-1]:
+            raise ValueError(f"Snapshot {timestamp} is not after the last stored snapshot {self.timestamps[-1]}")
+        # Ids are written first, the metadata written with the row counts them
+        self._add_entities(np.asarray(ids))
+        self._append_row(timestamp, self.columns(ids), {"points": points, "villages": villages, "rank": ranks})
+
+    def values_at(self, timestamp: int, ids, metric: str = "points") -> np.ndarray:
+        """Values of entities in the last snapshot taken at or before a time, MISSING for unknown entities.
+
+        Args:
+            timestamp (int): Time in epoch seconds.
+            ids (array-like): Playerids or tribeids.
+            metric (str, optional): One of METRICS. Defaults to "points".
+
+        Returns:
+            np.ndarray: Value per id.
+        """
+        row = self.matrix(metric)[self.index_at(timestamp)]
+        columns = self.columns(ids)
+        values = np.full(len(columns), self.MISSING, dtype=self.dtype)
+        known = (columns >= 0) & (columns < self.width)
+        values[known] = row[columns[known]]
+        return values
+
+    def top(self, n: int = 10, metric: str = "points", timestamp: int = None) -> np.ndarray:
+        """Ids of the top n entities of a snapshot, best first.
+
+        Args:
+            n (int, optional): Number of entities. Defaults to 10.
+            metric (str, optional): One of METRICS, rank 1 is best, the others are best when highest. Defaults to "points".
+            timestamp (int, optional): Time in epoch seconds, the last snapshot at or before it is used. Defaults to None (latest).
+
+        Returns:
+            np.ndarray: Up to n ids.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+        index = len(self) - 1 if timestamp is None else self.index_at(timestamp)
+        row = np.asarray(self.matrix(metric)[index, :self.entities])
+        present = np.flatnonzero(row != self.MISSING)
+        keys = row[present] if metric == "rank" else -row[present]
+        best = present[np.argsort(keys, kind="stable")[:n]]
+        return self.ids[best]
+
+    def series(self, ids, metric: str = "points", start: int = None, end: int = None) -> pd.DataFrame:
+        """Values of entities over a time range.
+
+        Args:
+            ids (array-like): Playerids or tribeids.
+            metric (str, optional): One of METRICS. Defaults to "points".
+            start (int, optional): First time in epoch seconds. Defaults to None (first snapshot).
+            end (int, optional): Last time in epoch seconds. Defaults to None (last snapshot).
+
+        Returns:
+            pd.DataFrame: One row per snapshot indexed by timestamp, one column per id, MISSING where the entity did not exist.
+        """
+        ids = np.atleast_1d(np.asarray(ids))
+        rows = self.rows_between(start, end)
+        columns = self.columns(ids)
+        values = np.full((rows.stop - rows.start, len(ids)), self.MISSING, dtype=self.dtype)
+        known = (columns >= 0) & (columns < self.width)
+        if known.any():
+            values[:, known] = self.matrix(metric)[rows][:, columns[known]]
+        return pd.DataFrame(values, index=pd.Index(self.timestamps[rows], name="timestamp"), columns=ids)
+
+    def top_series(self, n: int = 10, metric: str = "points", start: int = None, end: int = None, by: str = None) -> pd.DataFrame:
+        """Series of the top n entities over a time range, ranked at the end of the range.
+
+        Args:
+            n (int, optional): Number of entities. Defaults to 10.
+            metric (str, optional): Metric of the series. Defaults to "points".
+            start (int, optional): First time in epoch seconds. Defaults to None (first snapshot).
+            end (int, optional): Last time in epoch seconds, the entities are ranked here. Defaults to None (latest).
+            by (str, optional): Metric the entities are ranked by. Defaults to None (metric).
+
+        Returns:
+            pd.DataFrame: See series, columns ordered best first.
+        """
+        return self.series(self.top(n, by or metric, end), metric, start, end)
+
+
+class WorldTimeSeries:
+    """Player and tribe time series of a world, built from the player and ally tables of its snapshots.
+
+    Player ranks are by points, player village counts come from the player table. Tribe points
+    and ranks come from the ally table, tribe village counts are the sum of the members'.
+    """
+
+    REQUIREMENT = DataRequirement({
+        "ally": ["tribeid", "tribe_points", "rank"],
+        "player": ["playerid", "tribeid", "village_count", "points"],
+    })
+
+    def __init__(self, directory: str):
+        """Open (or create) the time series stored in a directory.
+
+        Args:
+            directory (str): Directory of the time series of one world.
+        """
+        self.directory = directory
+        self.players = EntityHistory(os.path.join(directory, "players"))
+        # Tribe points add up the points of all members and may exceed int32
+        self.tribes = EntityHistory(os.path.join(directory, "tribes"), dtype=np.int64)
+
+    @classmethod
+    def for_world(cls, server: str, world: str, history_dir: str = None) -> "WorldTimeSeries":
+        """Open the time series of a world.
+
+        Args:
+            server (str): Server, e.g. "en".
+            world (str): World number, e.g. "146".
+            history_dir (str, optional): Root directory of the histories. Defaults to $TWMAP_HISTORY_DIR or ~/.cache/twmap/history.
+
+        Returns:
+            WorldTimeSeries: The time series of the world.
+        """
+        return cls(os.path.join(history_root(history_dir), f"{server}{world}", "timeseries"))
+
+    def append(self, timestamp: int, player_df: pd.DataFrame, tribe_df: pd.DataFrame) -> None:
+        """Append one snapshot to the player and tribe series that do not have it yet.
+
+        Args:
+            timestamp (int): Snapshot time in epoch seconds.
+            player_df (pd.DataFrame): Player table with playerid, tribeid, village_count and points.
+            tribe_df (pd.DataFrame): Ally table with tribeid, tribe_points and rank.
+        """
+        if not len(self.players) or timestamp > self.players.timestamps[-1]:
+            ranks = player_df["points"].rank(method="min", ascending=False).astype(np.int64)
+            self.players.append(
+                timestamp, player_df["playerid"].to_numpy(), player_df["points"].to_numpy(),
+                player_df["village_count"].to_numpy(), ranks.to_numpy(),
+            )
+        if not len(self.tribes) or timestamp > self.tribes.timestamps[-1]:
+            tribe_villages = player_df.groupby("tribeid")["village_count"].sum()
+            self.tribes.append(
+                timestamp, tribe_df["tribeid"].to_numpy(), tribe_df["tribe_points"].to_numpy(),
+                tribe_df["tribeid"].map(tribe_villages).fillna(0).to_numpy(dtype=np.int64), tribe_df["rank"].to_numpy(),
+            )
+
+    def update(self, data_loader, read_ahead: int = 2) -> int:
+        """Append the snapshots of the world that are newer than the last stored one.
+
+        Args:
+            data_loader (DataLoader): Loader of the world's snapshots.
+            read_ahead (int, optional): Snapshots loaded ahead, see DataLoader.iter_snapshots. Defaults to 2.
+
+        Returns:
+            int: Number of appended snapshots.
+        """
+        last = [int(history.timestamps[-1]) if len(history) else None for history in (self.players, self.tribes)]
+        start = None if None in last else min(last) + 1
+        appended = 0
+        for bundle in data_loader.iter_snapshots(start=start, read_ahead=read_ahead, requirement=self.REQUIREMENT):
+            if bundle.tribe_df is None or bundle.player_df is None:
+                logging.warning(f"Skipping snapshot {bundle.snapshot.timestamp} without player or ally table")
+                continue
+            self.append(bundle.snapshot.timestamp, bundle.player_df, bundle.tribe_df)
+            appended += 1
+        logging.info(f"Appended {appended} snapshots to the time series {self.directory}, {len(self.players)} in total")
+        return appended
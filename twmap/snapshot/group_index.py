@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class GroupIndex:
+    """Row positions of a table grouped by a key column, built once with a single stable sort.
+
+    The positions of all rows are kept sorted by key, with the start and end offset of every
+    distinct key. Looking up the rows of a set of keys is then a binary search per key and a
+    gather, instead of a boolean mask over the whole table per key. Within a group the rows
+    keep their original order.
+    """
+
+    def __init__(self, keys: np.ndarray):
+        """Group row positions by key.
+
+        Args:
+            keys (np.ndarray): Key of every row, e.g. the playerid column of the villages.
+        """
+        keys = np.asarray(keys)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys, self.starts = np.unique(keys[self.order], return_index=True)
+        self.ends = np.append(self.starts[1:], len(keys)).astype(self.starts.dtype)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def positions(self, keys, sort: bool = False) -> np.ndarray:
+        """Get the row positions of the given keys.
+
+        Args:
+            keys (array-like): Keys to look up. Unknown keys have no rows.
+            sort (bool, optional): Return the positions in table order instead of grouped in the order of keys. Defaults to False.
+
+        Returns:
+            np.ndarray: Row positions, usable with DataFrame.iloc.
+        """
+        keys = np.asarray(keys)
+        if keys.ndim == 0:
+            keys = keys.reshape(1)
+        if sort:
+            # Set semantics like Series.isin, every row at most once
+            keys = np.unique(keys)
+        if len(keys) == 0 or len(self.keys) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        groups = np.searchsorted(self.keys, keys)
+        found = groups < len(self.keys)
+        found[found] = self.keys[groups[found]] == keys[found]
+        groups = groups[found]
+        if len(groups) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        positions = np.concatenate([self.order[self.starts[group]:self.ends[group]] for group in groups])
+        return np.sort(positions) if sort else positions
@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class HistoryStore:
+    """Append-only matrices of snapshot index x column in memory-mapped files on disk.
+
+    Every matrix gets one row per snapshot, in timestamp order, so appending a snapshot is a
+    write at the end of each file and a time range is a contiguous block of rows. Rows are
+    written before the metadata that counts them is atomically replaced, so an interrupted
+    append loses at most the row it was writing. When a row needs a column beyond the width of
+    the matrices they are rewritten wider, into new files.
+    """
+
+    DTYPE = np.dtype("<i4")
+    # Cells without a value, e.g. villages that do not exist in a snapshot
+    MISSING = -1
+    # Width of the matrices is rounded up to this many columns
+    WIDTH_STEP = 1024
+    # Factor the width grows by at least when widening, above 1 when columns are added steadily
+    GROWTH = 1.0
+    # Names of the matrices, set by subclasses
+    MATRICES = ()
+
+    def __init__(self, directory: str, dtype=None):
+        """Open (or create) the store in a directory.
+
+        Args:
+            directory (str): Directory of the store.
+            dtype (np.dtype, optional): Integer type of the cells. Defaults to DTYPE.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "history.json")
+        self.dtype = np.dtype(dtype or self.DTYPE).newbyteorder("<")
+
+        self.width = 0
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self._matrices = {}
+        self._load_meta()
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def _matrix_path(self, name: str, width: int) -> str:
+        return os.path.join(self.directory, f"{name}_{width}.i{self.dtype.itemsize * 8}")
+
+    def _read_meta(self, meta: dict) -> None:
+        """Restore subclass state from the metadata."""
+
+    def _write_meta(self) -> dict:
+        """Subclass state to store in the metadata."""
+        return {}
+
+    def _load_meta(self) -> None:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+        except FileNotFoundError:
+            return
+        self.width = meta["width"]
+        self.timestamps = np.asarray(meta["timestamps"], dtype=np.int64)
+        self._read_meta(meta)
+
+    def _save_meta(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump({"width": self.width, "timestamps": self.timestamps.tolist(), **self._write_meta()}, tmp_file)
+        os.replace(tmp_path, self.meta_path)
+
+    def _map(self, name: str) -> np.ndarray:
+        if len(self) == 0 or self.width == 0:
+            return np.empty((0, self.width), dtype=self.dtype)
+        return np.memmap(self._matrix_path(name, self.width), dtype=self.dtype, mode="r", shape=(len(self), self.width))
+
+    def matrix(self, name: str) -> np.ndarray:
+        """Read-only memory-mapped matrix, snapshots as rows."""
+        matrix = self._matrices.get(name)
+        if matrix is None:
+            matrix = self._map(name)
+            self._matrices[name] = matrix
+        return matrix
+
+    def _widen(self, columns: int) -> None:
+        """Rewrite the matrices with room for the given number of columns, into new files."""
+        width = max(columns, int(self.width * self.GROWTH))
+        width = -(-width // self.WIDTH_STEP) * self.WIDTH_STEP
+        for name in self.MATRICES:
+            old = self._map(name)
+            with open(self._matrix_path(name, width), "wb") as matrix_file:
+                row = np.full(width, self.MISSING, dtype=self.dtype)
+                for old_row in old:
+                    row[:self.width] = old_row
+                    matrix_file.write(row.tobytes())
+            del old
+        old_width = self.width
+        self._matrices = {}
+        self.width = width
+        self._save_meta()
+        for name in self.MATRICES:
+            if old_width:
+                try:
+                    os.remove(self._matrix_path(name, old_width))
+                except FileNotFoundError:
+                    pass
+        logging.info(f"Widened {type(self).__name__} {self.directory} to {width} columns")
+
+    def _append_row(self, timestamp: int, columns: np.ndarray, values: dict) -> None:
+        """Append one snapshot.
+
+        Args:
+            timestamp (int): Snapshot time in epoch seconds, after the last stored snapshot.
+            columns (np.ndarray): Columns that have a value in this snapshot.
+            values (dict): matrix name -> value per column, the other cells are MISSING.
+
+        Raises:
+            ValueError: When the snapshot is not newer than the last stored one.
+        """
+        if len(self) and timestamp <= self.timestamps[-1]:
+            raise ValueError(f"Snapshot {timestamp} is not after the last stored snapshot {self.timestamps[-1]}")
+
+        columns = np.asarray(columns)
+        if len(columns) and columns.max() >= self.width:
+            self._widen(int(columns.max()) + 1)
+
+        row_offset = len(self) * self.width * self.dtype.itemsize
+        for name in self.MATRICES:
+            row = np.full(self.width, self.MISSING, dtype=self.dtype)
+            row[columns] = values[name]
+            path = self._matrix_path(name, self.width)
+            with open(path, "r+b" if os.path.exists(path) else "wb") as matrix_file:
+                # Drops rows of an interrupted append that the metadata does not count
+                matrix_file.seek(row_offset)
+                matrix_file.truncate()
+                matrix_file.write(row.tobytes())
+
+        self.timestamps = np.append(self.timestamps, np.int64(timestamp))
+        self._matrices = {}
+        self._save_meta()
+
+    def index_at(self, timestamp: int) -> int:
+        """Row of the last snapshot taken at or before a time.
+
+        Raises:
+            KeyError: When the store has no snapshot at or before the time.
+        """
+        index = int(np.searchsorted(self.timestamps, timestamp, side="right")) - 1
+        if index < 0:
+            raise KeyError(f"No snapshot at or before {timestamp}")
+        return index
+
+    def rows_between(self, start: int = None, end: int = None) -> slice:
+        """Rows of the snapshots taken between two times, both inclusive.
+
+        Args:
+            start (int, optional): First time in epoch seconds. Defaults to None (first snapshot).
+            end (int, optional): Last time in epoch seconds. Defaults to None (last snapshot).
+
+        Returns:
+            slice: The rows, usable on every matrix and on timestamps.
+        """
+        first = 0 if start is None else int(np.searchsorted(self.timestamps, start, side="left"))
+        last = len(self) if end is None else int(np.searchsorted(self.timestamps, end, side="right"))
+        return slice(first, max(first, last))
@@ -0,0 +1,141 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from twmap.snapshot.history_store import HistoryStore
+from twmap.snapshot.requirement import DataRequirement
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def history_root(history_dir: str = None) -> str:
+    """Root directory of the per-world histories: history_dir, else $TWMAP_HISTORY_DIR or ~/.cache/twmap/history."""
+    return history_dir or os.environ.get("TWMAP_HISTORY_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "twmap", "history")
+
+
+class OwnershipHistory(HistoryStore):
+    """Village ownership of every snapshot of a world, in memory-mapped files on disk.
+
+    Two int32 matrices of snapshot index x villageid hold the owning playerid and the tribeid of
+    that player, one row per snapshot in timestamp order. A frame is a zero-copy row of the
+    mapping, and the history of a village is a column scan instead of one village file parse
+    per snapshot.
+
+    The history is built by walking the snapshots once, later updates only append the snapshots
+    after the last stored one, see HistoryStore.
+    """
+
+    MATRICES = ("players", "tribes")
+
+    REQUIREMENT = DataRequirement({
+        "village": ["villageid", "playerid"],
+        "player": ["playerid", "tribeid"],
+    })
+
+    @classmethod
+    def for_world(cls, server: str, world: str, history_dir: str = None) -> "OwnershipHistory":
+        """Open the history of a world.
+
+        Args:
+            server (str): Server, e.g. "en".
+            world (str): World number, e.g. "146".
+            history_dir (str, optional): Root directory of the histories. Defaults to $TWMAP_HISTORY_DIR or ~/.cache/twmap/history.
+
+        Returns:
+            OwnershipHistory: The history of the world.
+        """
+        return cls(os.path.join(history_root(history_dir), f"{server}{world}"))
+
+    @property
+    def players(self) -> np.ndarray:
+        """Owning playerid per snapshot (rows) and villageid (columns), 0 for barbarians. Read-only."""
+        return self.matrix("players")
+
+    @property
+    def tribes(self) -> np.ndarray:
+        """Tribeid of the owner per snapshot (rows) and villageid (columns), 0 for players without a tribe
+        and -1 for barbarians, see DataFilter.village_tribeids. Read-only."""
+        return self.matrix("tribes")
+
+    def append(self, timestamp: int, villageids: np.ndarray, playerids: np.ndarray, tribeids: np.ndarray) -> None:
+        """Append the ownership of one snapshot.
+
+        Args:
+            timestamp (int): Snapshot time in epoch seconds, after the last stored snapshot.
+            villageids (np.ndarray): Villages of the snapshot.
+            playerids (np.ndarray): Owner of every village, 0 for barbarians.
+            tribeids (np.ndarray): Tribe of the owner of every village, -1 when unknown.
+
+        Raises:
+            ValueError: When the snapshot is not newer than the last stored one.
+        """
+        self._append_row(timestamp, villageids, {"players": playerids, "tribes": tribeids})
+
+    def update(self, data_loader, read_ahead: int = 2) -> int:
+        """Append the snapshots of the world that are newer than the last stored one.
+
+        Snapshots are streamed with DataLoader.iter_snapshots, loading only the village owners and
+        the player tribes. Snapshots older than the last stored one are not added later.
+
+        Args:
+            data_loader (DataLoader): Loader of the world's snapshots.
+            read_ahead (int, optional): Snapshots loaded ahead, see DataLoader.iter_snapshots. Defaults to 2.
+
+        Returns:
+            int: Number of appended snapshots.
+        """
+        start = int(self.timestamps[-1]) + 1 if len(self) else None
+        appended = 0
+        for bundle in data_loader.iter_snapshots(start=start, read_ahead=read_ahead, requirement=self.REQUIREMENT):
+            village_df = bundle.village_df
+            self.append(
+                bundle.snapshot.timestamp, village_df["villageid"].to_numpy(), village_df["playerid"].to_numpy(),
+                bundle.data_filter().village_tribeids,
+            )
+            appended += 1
+        logging.info(f"Appended {appended} snapshots to ownership history {self.directory}, {len(self)} in total")
+        return appended
+
+    def frame(self, timestamp: int) -> tuple:
+        """Ownership of the last snapshot taken at or before a time.
+
+        Args:
+            timestamp (int): Time in epoch seconds.
+
+        Returns:
+            tuple: (playerids, tribeids) indexed by villageid, zero-copy views of the memory-mapped rows.
+        """
+        index = self.index_at(timestamp)
+        return self.players[index], self.tribes[index]
+
+    def village_history(self, villageid: int) -> pd.DataFrame:
+        """Owner of a village in every snapshot.
+
+        Returns:
+            pd.DataFrame: timestamp, playerid and tribeid per snapshot, playerid is -1 while the village did not exist.
+        """
+        if villageid >= self.width:
+            return pd.DataFrame({"timestamp": self.timestamps, "playerid": self.MISSING, "tribeid": self.MISSING})
+        return pd.DataFrame({
+            "timestamp": self.timestamps,
+            "playerid": np.asarray(self.players[:, villageid]),
+            "tribeid": np.asarray(self.tribes[:, villageid]),
+        })
+
+    def ownership_changes(self, villageid: int) -> pd.DataFrame:
+        """Snapshots in which a village changed owner compared to the snapshot before, including when it appeared.
+
+        Returns:
+            pd.DataFrame: timestamp, old_playerid, new_playerid, old_tribeid and new_tribeid per change.
+        """
+        history = self.village_history(villageid)
+        changed = np.flatnonzero(np.diff(history["playerid"].to_numpy())) + 1
+        return pd.DataFrame({
+            "timestamp": history["timestamp"].to_numpy()[changed],
+            "old_playerid": history["playerid"].to_numpy()[changed - 1],
+            "new_playerid": history["playerid"].to_numpy()[changed],
+            "old_tribeid": history["tribeid"].to_numpy()[changed - 1],
+            "new_tribeid": history["tribeid"].to_numpy()[changed],
+        })
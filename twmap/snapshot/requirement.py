@@ -0,0 +1,73 @@
+from functools import lru_cache
+
+from pydantic import BaseModel, create_model
+
+from twmap.snapshot.columnar import COLUMNAR_TABLES
+
+
+@lru_cache(maxsize=None)
+def project_model(model: type[BaseModel], columns: tuple) -> type[BaseModel]:
+    """Get a data model with only the given fields of a model, in the field order of the model.
+
+    Projected tables are validated against it, so only the loaded columns are checked.
+
+    Args:
+        model (type[BaseModel]): Data model of one row.
+        columns (tuple): Fields to keep.
+
+    Returns:
+        type[BaseModel]: The model itself when all its fields are kept.
+    """
+    if columns == tuple(model.model_fields):
+        return model
+    fields = {column: (field.annotation, ...) for column, field in model.model_fields.items() if column in columns}
+    return create_model(model.__name__, __doc__=model.__doc__, **fields)
+
+
+class DataRequirement:
+    """The snapshot tables, and the columns of each, that a consumer of the data reads.
+
+    The data loader only downloads the required tables and only parses, validates and keeps the
+    required columns. Tables that are not required are returned as None. The world's conquer
+    file is shared by all snapshots and always loaded.
+    """
+
+    def __init__(self, tables: dict):
+        """Declare a requirement.
+
+        Args:
+            tables (dict): table name (see COLUMNAR_TABLES) -> column names, or None for all columns.
+
+        Raises:
+            ValueError: For an unknown table or column.
+        """
+        self.tables = {}
+        for name, columns in tables.items():
+            if name not in COLUMNAR_TABLES:
+                raise ValueError(f"Unknown snapshot table {name}")
+            fields = tuple(COLUMNAR_TABLES[name][1].model_fields)
+            if columns is None:
+                self.tables[name] = fields
+                continue
+            unknown = set(columns) - set(fields)
+            if unknown:
+                raise ValueError(f"Unknown columns of snapshot table {name}: {sorted(unknown)}")
+            self.tables[name] = tuple(column for column in fields if column in columns)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tables
+
+    def __repr__(self) -> str:
+        return f"DataRequirement({self.tables})"
+
+    def columns(self, name: str) -> tuple:
+        """Required columns of a table, in file order."""
+        return self.tables[name]
+
+    def model(self, name: str) -> type[BaseModel]:
+        """Data model of the required columns of a table."""
+        return project_model(COLUMNAR_TABLES[name][1], self.tables[name])
+
+
+# Every column of every table, what the loaders read when no requirement is given
+ALL_TABLES = DataRequirement({name: None for name in COLUMNAR_TABLES})
@@ -0,0 +1,93 @@
+import logging
+
+import pandas as pd
+from pandantic import Pandantic
+from pydantic import BaseModel
+
+# Columns holding ids of villages, players or tribes. 0 is a valid id (barbarians / no tribe).
+ID_COLUMNS = {"villageid", "playerid", "tribeid", "new_owner_id", "old_owner_id"}
+
+# Columns holding world coordinates, worlds are at most 1000 x 1000
+COORDINATE_COLUMNS = {"x_coord", "y_coord"}
+COORDINATE_RANGE = (0, 999)
+
+
+class SnapshotSchemaError(ValueError):
+    """Raised when a snapshot table does not match its data model."""
+
+
+class SnapshotSchemaValidator:
+    """Validates snapshot tables against their pydantic data models.
+
+    The default check is vectorized: it verifies the columns, that every int field has an
+    integer dtype (which also rules out missing values), that str fields hold strings, that ids
+    are non-negative and that coordinates are inside the world. Row-level pydantic validation
+    through Pandantic is only run on a random sample of rows, or on every row in strict mode.
+    """
+
+    def __init__(self, strict: bool = False, sample_size: int = 100):
+        """Configure how thoroughly tables are validated.
+
+        Args:
+            strict (bool, optional): Validate every row with Pandantic. Defaults to False.
+            sample_size (int, optional): Rows validated with Pandantic when not strict, 0 to skip. Defaults to 100.
+        """
+        self.strict = strict
+        self.sample_size = sample_size
+
+    def check_columns(self, df: pd.DataFrame, model: type[BaseModel]) -> None:
+        """Vectorized schema check of one table.
+
+        Args:
+            df (pd.DataFrame): Table as read from the snapshot file.
+            model (type[BaseModel]): Data model of one row.
+
+        Raises:
+            SnapshotSchemaError: When the table does not match the model.
+        """
+        expected_columns = list(model.model_fields.keys())
+        if list(df.columns) != expected_columns:
+            raise SnapshotSchemaError(f"{model.__name__}: expected columns {expected_columns}, got {list(df.columns)}")
+
+        for column, field in model.model_fields.items():
+            values = df[column]
+            if field.annotation is int:
+                if not pd.api.types.is_integer_dtype(values.dtype):
+                    raise SnapshotSchemaError(f"{model.__name__}.{column}: expected integers, got {values.dtype}")
+                if len(values) == 0:
+                    continue
+                if column in ID_COLUMNS and values.min() < 0:
+                    raise SnapshotSchemaError(f"{model.__name__}.{column}: negative id {values.min()}")
+                if column in COORDINATE_COLUMNS and (values.min() < COORDINATE_RANGE[0] or values.max() > COORDINATE_RANGE[1]):
+                    raise SnapshotSchemaError(
+                        f"{model.__name__}.{column}: coordinates outside {COORDINATE_RANGE}: {values.min()}..{values.max()}"
+                    )
+            elif field.annotation is str:
+                # read_csv only yields a non-object column here when every value parsed as a number
+                if not pd.api.types.is_object_dtype(values.dtype) and not pd.api.types.is_string_dtype(values.dtype):
+                    raise SnapshotSchemaError(f"{model.__name__}.{column}: expected strings, got {values.dtype}")
+
+    def validate(self, df: pd.DataFrame, model: type[BaseModel]) -> pd.DataFrame:
+        """Validate a table, returning it unchanged when it is valid.
+
+        Args:
+            df (pd.DataFrame): Table as read from the snapshot file.
+            model (type[BaseModel]): Data model of one row.
+
+        Raises:
+            SnapshotSchemaError: When the vectorized schema check fails.
+            pydantic.ValidationError: When a Pandantic validated row is invalid.
+
+        Returns:
+            pd.DataFrame: The validated table.
+        """
+        self.check_columns(df, model)
+
+        if self.strict:
+            Pandantic(model).validate(df)
+        elif self.sample_size and len(df) > 0:
+            sample = df.sample(n=min(self.sample_size, len(df)), random_state=0) if len(df) > self.sample_size else df
+            Pandantic(model).validate(sample)
+            logging.debug(f"Validated {len(sample)} of {len(df)} {model.__name__} rows with Pandantic")
+
+        return df
@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from botocore.exceptions import ClientError
+
+from twmap.world.world_loader import WorldLoader
+
+
+class SnapshotCache:
+    """On-disk cache of snapshot files downloaded from S3.
+
+    Objects are stored content-addressed by (bucket, key, ETag), and a small ref file per
+    (bucket, key) records the latest ETag seen. Timestamped dumps are written once and never
+    change, so once cached they are served from disk without contacting S3. Files that are
+    rewritten in place (conquer.txt, columnar files converted again) are revalidated with a
+    conditional GET, so they only cost body bytes when they changed. In offline mode S3 is
+    never contacted and only cached files are served.
+
+    Writes go to a temporary file that is atomically renamed into place, so several worker
+    threads or processes can share one cache directory. The cache is kept under max_bytes by
+    evicting the least recently used objects.
+    """
+
+    DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        """Create a cache rooted at cache_dir.
+
+        Args:
+            cache_dir (str, optional): Cache directory. Defaults to $TWMAP_CACHE_DIR or ~/.cache/twmap/snapshots.
+            max_bytes (int, optional): Size budget for cached objects. Defaults to 5 GiB.
+            offline (bool, optional): Only serve from cache, never contact S3. Defaults to False.
+        """
+        self.cache_dir = cache_dir or os.environ.get("TWMAP_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "twmap", "snapshots")
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+        self.objects_dir = os.path.join(self.cache_dir, "objects")
+        self.refs_dir = os.path.join(self.cache_dir, "refs")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.refs_dir, exist_ok=True)
+
+        # Size of the cached objects as last scanned plus what this process wrote since
+        self._cached_bytes = None
+
+        # Statistics for this process
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+
+    @staticmethod
+    def _digest(*parts: str) -> str:
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _ref_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.refs_dir, self._digest(bucket, key))
+
+    def _object_path(self, bucket: str, key: str, etag: str) -> str:
+        digest = self._digest(bucket, key, etag)
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _read_ref(self, bucket: str, key: str):
+        try:
+            with open(self._ref_path(bucket, key), "r", encoding="utf-8") as ref_file:
+                return ref_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    @staticmethod
+    def is_immutable(key: str) -> bool:
+        """Whether the object at a key is never rewritten: timestamped dumps, e.g. en146/village_en146_20250930_221458.txt.
+
+        Columnar files carry the timestamp of their snapshot as well, but convert_all_snapshots can rewrite them.
+        """
+        return WorldLoader.key_timestamp_str(key) is not None and "/columnar/" not in key
+
+    def _read_object(self, path: str) -> bytes:
+        with open(path, "rb") as object_file:
+            data = object_file.read()
+        # Reading marks the object as recently used for eviction
+        os.utime(path)
+        return data
+
+    def get(self, s3_client, bucket: str, key: str) -> bytes:
+        """Return the contents of s3://bucket/key, from cache when it is still current.
+
+        Args:
+            s3_client: boto3 S3 client used for cache misses and revalidation.
+            bucket (str): S3 bucket.
+            key (str): S3 object key.
+
+        Raises:
+            FileNotFoundError: In offline mode, when the object is not cached.
+
+        Returns:
+            bytes: Object contents.
+        """
+        etag = self._read_ref(bucket, key)
+        cached_path = self._object_path(bucket, key, etag) if etag is not None else None
+
+        if self.offline:
+            try:
+                data = self._read_object(cached_path) if cached_path else None
+            except FileNotFoundError:
+                data = None
+            if data is None:
+                raise FileNotFoundError(f"s3://{bucket}/{key} is not in the snapshot cache (offline mode)")
+            self.hits += 1
+            return data
+
+        if cached_path is not None and self.is_immutable(key):
+            try:
+                data = self._read_object(cached_path)
+                self.hits += 1
+                return data
+            except FileNotFoundError:
+                # Evicted, download it again
+                pass
+
+        request = {"Bucket": bucket, "Key": key}
+        if cached_path is not None and os.path.exists(cached_path):
+            request["IfNoneMatch"] = etag
+
+        try:
+            response = s3_client.get_object(**request)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("304", "NotModified"):
+                raise
+            try:
+                data = self._read_object(cached_path)
+                self.hits += 1
+                self.revalidations += 1
+                return data
+            except FileNotFoundError:
+                # Evicted by another worker in the meantime
+                response = s3_client.get_object(Bucket=bucket, Key=key)
+
+        data = response["Body"].read()
+        self.misses += 1
+        self.bytes_downloaded += len(data)
+
+        etag = response["ETag"]
+        self._atomic_write(self._object_path(bucket, key, etag), data)
+        self._atomic_write(self._ref_path(bucket, key), etag.encode("utf-8"))
+
+        if self._cached_bytes is not None:
+            self._cached_bytes += len(data)
+        if self._cached_bytes is None or self._cached_bytes > self.max_bytes:
+            self.evict()
+        return data
+
+    def evict(self) -> None:
+        """Remove least recently used objects until the cache fits in max_bytes."""
+        entries = []
+        total_bytes = 0
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_bytes += stat.st_size
+
+        if total_bytes > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    logging.debug(f"Evicted {path} from snapshot cache")
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+
+        self._cached_bytes = total_bytes
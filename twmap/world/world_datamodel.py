@@ -47,6 +47,17 @@ class SnapshotFileModel(BaseWorldModel):
     killdef_data_path: Optional[str] = None
     killtribeatt_data_path: Optional[str] = None
     killtribedef_data_path: Optional[str] = None
+    columnar_data_path: Optional[str] = None  # All tables above in one columnar file, if converted
+
+class SnapshotManifestModel(BaseWorldModel):
+    """Persisted listing of the snapshot files of a world, used for incremental scans.
+
+    Args:
+        BaseWorldModel (_type_): The base world model class.
+    """
+    keys: List[str] = Field(default_factory=list, description="All snapshot file keys found in S3, sorted.")
+    snapshots: List[SnapshotFileModel] = Field(default_factory=list, description="Snapshots matched from the keys.")
+    last_updated: Optional[int] = None
 
 class TimelapseImageModel(SnapshotFileModel):
     """Represents a timelapse image for a world.
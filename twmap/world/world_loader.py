@@ -2,20 +2,79 @@ import pandas as pd
 from typing import Optional, List
 import boto3
 import logging
-from datetime import datetime, timezone
+import bisect
+from datetime import datetime, timedelta, timezone
 
 import sys, os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 
-from twmap.world.world_datamodel import WorldModel, TimelapseImageModel, SnapshotFileModel
+from twmap.world.world_datamodel import WorldModel, TimelapseImageModel, SnapshotFileModel, SnapshotManifestModel
 import csv
 
 
+class SnapshotFileIndex:
+    """Snapshot files of one type sorted by timestamp, for closest-timestamp lookups with bisect.
+
+    Also records which files were matched, so files that belong to no snapshot or to several
+    snapshots can be reported after matching.
+    """
+
+    def __init__(self, file_dict: dict):
+        """Index the files of one type.
+
+        Args:
+            file_dict (dict): timestamp string -> (datetime, key), as collected while scanning.
+        """
+        entries = sorted(file_dict.values(), key=lambda entry: entry[0])
+        self.datetimes = [file_dt for file_dt, _ in entries]
+        self.keys = [key for _, key in entries]
+        self.match_counts = [0] * len(entries)
+        self.ties = []
+
+    def closest(self, target_dt: datetime, max_diff_seconds: float) -> Optional[str]:
+        """Find the file closest to target_dt within max_diff_seconds, the earlier file on a tie.
+
+        Args:
+            target_dt (datetime): Time to match, e.g. of a village file.
+            max_diff_seconds (float): Largest accepted difference in seconds.
+
+        Returns:
+            Optional[str]: Key of the closest file or None if no file is close enough.
+        """
+        i = bisect.bisect_left(self.datetimes, target_dt)
+        candidates = []
+        if i > 0:
+            candidates.append(((target_dt - self.datetimes[i - 1]).total_seconds(), i - 1))
+        if i < len(self.datetimes):
+            candidates.append(((self.datetimes[i] - target_dt).total_seconds(), i))
+        candidates = [(diff, j) for diff, j in candidates if diff <= max_diff_seconds]
+        if not candidates:
+            return None
+
+        # min keeps the first (earlier) candidate on equal differences, like the former linear scan
+        diff, j = min(candidates, key=lambda candidate: candidate[0])
+        if len(candidates) == 2 and candidates[0][0] == candidates[1][0]:
+            self.ties.append(target_dt.strftime("%Y%m%d_%H%M%S"))
+        self.match_counts[j] += 1
+        return self.keys[j]
+
+    def report(self) -> dict:
+        """Files matched to no lookup, files matched to several lookups and lookups with two equally close files."""
+        return {
+            "unmatched": [key for key, count in zip(self.keys, self.match_counts) if count == 0],
+            "shared": [key for key, count in zip(self.keys, self.match_counts) if count > 1],
+            "ties": list(self.ties),
+        }
+
+
 class WorldLoader:
     """Controls whether data is available for a world and whether Timelapse images have been generated.
     """
 
+    # Files of one snapshot are written within this many seconds of the village file
+    MATCH_TOLERANCE_SECONDS = 3600
+
     def __init__(self, world: str, server: str, s3_image_bucket: Optional[str] = None, s3_snapshot_bucket: Optional[str] = None, init_load: bool = True):
         self.world = world  # e.g. 142
         self.server = server  # e.g. en
@@ -26,6 +85,7 @@ class WorldLoader:
         self.logger = logging.getLogger(__name__)
 
         self.world_model: Optional[WorldModel] = None
+        self.match_report = {}  # file type -> unmatched/shared/tied files of the last match_snapshot_files
 
         self.ally_file_prefix = f"{self.server}{self.world}/ally_{self.server}{self.world}_"
         self.player_file_prefix = f"{self.server}{self.world}/player_{self.server}{self.world}_"
@@ -37,6 +97,7 @@ class WorldLoader:
         self.killdef_file_prefix = f"{self.server}{self.world}/killdef_{self.server}{self.world}_"
         self.killtribeatt_file_prefix = f"{self.server}{self.world}/killatttribe_{self.server}{self.world}_"
         self.killtribedef_file_prefix = f"{self.server}{self.world}/killdeftribe_{self.server}{self.world}_"
+        self.columnar_file_prefix = f"{self.server}{self.world}/columnar/snapshot_{self.server}{self.world}_"
 
         self.top_players_image_path = f"{self.server}{self.world}/top_players/"
         self.top_tribes_image_path = f"{self.server}{self.world}/top_tribes/"
@@ -45,6 +106,7 @@ class WorldLoader:
 
         self.settings_dir = f"settings/{self.server}{self.world}/"
         self.world_settings_file = f"{self.settings_dir}world_settings.json"
+        self.snapshot_manifest_file = f"{self.settings_dir}snapshot_manifest.json"
         
         if init_load:
             self.snapshots: List[SnapshotFileModel] = self.scan_available_snapshots()
@@ -97,7 +159,91 @@ class WorldLoader:
         self.save_world()
         return self.world_model
     
-    def scan_available_snapshots(self) -> List[SnapshotFileModel]:
+    def snapshot_file_prefixes(self) -> List[str]:
+        """Key prefixes of all snapshot files of the world, listed separately for incremental scans."""
+        return [
+            self.village_file_prefix, self.player_file_prefix, self.ally_file_prefix, self.conquer_file_prefix,
+            self.killall_file_prefix, self.killall_tribe_file_prefix, self.killatt_file_prefix, self.killdef_file_prefix,
+            self.killtribeatt_file_prefix, self.killtribedef_file_prefix, self.columnar_file_prefix,
+        ]
+
+    @staticmethod
+    def key_timestamp_str(key: str) -> Optional[str]:
+        """The YYYYMMDD_HHMMSS timestamp at the end of a snapshot file key, None if it has none.
+
+        These strings sort like the timestamps they represent, so keys can be compared without parsing them.
+        """
+        parts = key.rsplit("/", 1)[-1].rsplit(".", 1)[0].split("_")
+        if len(parts) < 2 or len(parts[-2]) != 8 or len(parts[-1]) != 6 or not (parts[-2] + parts[-1]).isdigit():
+            return None
+        return f"{parts[-2]}_{parts[-1]}"
+
+    def load_snapshot_manifest(self) -> Optional[SnapshotManifestModel]:
+        """Load the persisted listing of the last snapshot scan from S3.
+
+        Returns:
+            Optional[SnapshotManifestModel]: The manifest or None if there is none yet.
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.s3_image_bucket, Key=self.snapshot_manifest_file)
+            return SnapshotManifestModel.model_validate_json(response['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            self.logger.info(f"No snapshot manifest for {self.server}{self.world}, doing a full scan.")
+            return None
+        except Exception as e:
+            self.logger.warning(f"Could not load snapshot manifest for {self.server}{self.world}, doing a full scan: {e}")
+            return None
+
+    def save_snapshot_manifest(self, keys: List[str], snapshots: List[SnapshotFileModel]) -> None:
+        """Persist the listing and matched snapshots of a scan to S3."""
+        manifest = SnapshotManifestModel(
+            world=self.world,
+            server=self.server,
+            keys=keys,
+            snapshots=snapshots,
+            last_updated=int(datetime.now(timezone.utc).timestamp()),
+        )
+        try:
+            self.s3_client.put_object(Bucket=self.s3_image_bucket, Key=self.snapshot_manifest_file, Body=manifest.model_dump_json())
+        except Exception as e:
+            self.logger.warning(f"Could not save snapshot manifest for {self.server}{self.world}: {e}")
+
+    def list_new_snapshot_keys(self, known_keys: List[str]) -> List[str]:
+        """List the snapshot files added after the newest known file of every file type.
+
+        S3 lists keys in lexicographic order and the timestamp is the last part of every key,
+        so listing each file type prefix with StartAfter set to its newest known key returns
+        exactly the files written since. Columnar files are not written in timestamp order,
+        convert_all_snapshots fills in snapshots that failed before on a later run, so their
+        prefix is always listed in full (one key per snapshot).
+
+        Args:
+            known_keys (List[str]): Keys of the last listing.
+
+        Returns:
+            List[str]: New keys.
+        """
+        prefixes = self.snapshot_file_prefixes()
+        newest = {}
+        for key in known_keys:
+            prefix = next((prefix for prefix in prefixes if key.startswith(prefix)), None)
+            if prefix is not None and key > newest.get(prefix, ""):
+                newest[prefix] = key
+
+        new_keys = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for prefix in prefixes:
+            params = {"Bucket": self.s3_snapshot_bucket, "Prefix": prefix}
+            if prefix in newest and prefix != self.columnar_file_prefix:
+                params["StartAfter"] = newest[prefix]
+            for page in paginator.paginate(**params):
+                new_keys.extend(obj['Key'] for obj in page.get('Contents', []))
+
+        # Files rewritten in place (conquer.txt) are listed again but are not new
+        known = set(known_keys)
+        return sorted(set(key for key in new_keys if key not in known))
+
+    def scan_available_snapshots(self, full_rescan: bool = False) -> List[SnapshotFileModel]:
         """Scan S3 for available snapshot files for the world.
 
         Files are saved in the following format: 
@@ -108,6 +254,13 @@ class WorldLoader:
         The timestamp between the files is not the same, so we need to match
         files with closest timestamps and ensure each snapshot has all four files.
 
+        The listing and the matched snapshots are persisted in a manifest next to the world
+        settings. Later scans only list files newer than the manifest and only rematch the
+        snapshots those files can affect.
+
+        Args:
+            full_rescan (bool, optional): Ignore the manifest and list every file, e.g. after files were deleted. Defaults to False.
+
         Returns:
             List[SnapshotFileModel]: A list of available snapshot file models.
         """
@@ -115,195 +268,52 @@ class WorldLoader:
         snapshot_files = []
         try:
             prefix = f"{self.server}{self.world}/"
-            self.logger.info(f"Scanning S3 bucket '{self.s3_snapshot_bucket}' with prefix '{prefix}'")
-            
-            # Get all files using pagination
-            files = []
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            page_iterator = paginator.paginate(Bucket=self.s3_snapshot_bucket, Prefix=prefix)
-            
-            for page in page_iterator:
-                if 'Contents' in page:
-                    files.extend(page['Contents'])
-            
-            self.logger.info(f"Found {len(files)} total files in S3")
-            
-            if files:
-                
-                # Log the file prefixes we're looking for
-                self.logger.info(f"Looking for files with prefixes:")
-                self.logger.info(f"  Village: {self.village_file_prefix}")
-                self.logger.info(f"  Player: {self.player_file_prefix}")
-                self.logger.info(f"  Ally: {self.ally_file_prefix}")
-                self.logger.info(f"  Conquer: {self.conquer_file_prefix}")
-                
-                # Collect files by type with their timestamps and datetime objects
-                village_files = {}  # timestamp -> (datetime_obj, full_key)
-                player_files = {}
-                ally_files = {}
-                conquer_files = {}
-                killall_files = {}
-                killall_tribe_files = {}
-                killatt_files = {}
-                killdef_files = {}
-                killtribeatt_files = {}
-                killtribedef_files = {}
-
-                # Log first few files to see what we're working with
-                for i, file in enumerate(files[:10]):
-                    self.logger.info(f"Sample file {i+1}: {file['Key']}")
-                
-                # Track file types for analysis
-                other_files = []
-                
-                for file in files:
-                    key = file['Key']
-                    try:
-                        if key.startswith(self.village_file_prefix):
-                            timestamp_str = key[len(self.village_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            village_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.player_file_prefix):
-                            timestamp_str = key[len(self.player_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            player_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.ally_file_prefix):
-                            timestamp_str = key[len(self.ally_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            ally_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.conquer_file_prefix):
-                            # just grab conquer.txt
-                            conquer_files["conquer"] = (None, key)
-                        elif key.startswith(self.killall_file_prefix):
-                            timestamp_str = key[len(self.killall_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            killall_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.killall_tribe_file_prefix):
-                            timestamp_str = key[len(self.killall_tribe_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            killall_tribe_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.killatt_file_prefix):
-                            timestamp_str = key[len(self.killatt_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            killatt_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.killdef_file_prefix):
-                            timestamp_str = key[len(self.killdef_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            killdef_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.killtribeatt_file_prefix):
-                            timestamp_str = key[len(self.killtribeatt_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            killtribeatt_files[timestamp_str] = (dt_obj, key)
-                        elif key.startswith(self.killtribedef_file_prefix):
-                            timestamp_str = key[len(self.killtribedef_file_prefix):-4]
-                            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-                            killtribedef_files[timestamp_str] = (dt_obj, key)
-                        else:
-                            other_files.append(key)
-                    except Exception as e:
-                        self.logger.warning(f"Could not parse filename {key}: {e}")
-                        continue
-
-                self.logger.info(f"Found files by type:")
-                self.logger.info(f"  Village files: {len(village_files)}")
-                if village_files:
-                    sample_village = list(village_files.values())[0][1]
-                    self.logger.info(f"    Sample: {sample_village}")
-                self.logger.info(f"  Player files: {len(player_files)}")
-                if player_files:
-                    sample_player = list(player_files.values())[0][1]
-                    self.logger.info(f"    Sample: {sample_player}")
-                self.logger.info(f"  Ally files: {len(ally_files)}")
-                if ally_files:
-                    sample_ally = list(ally_files.values())[0][1]
-                    self.logger.info(f"    Sample: {sample_ally}")
-                self.logger.info(f"  Conquer files: {len(conquer_files)}")
-                if conquer_files:
-                    sample_conquer = list(conquer_files.values())[0][1]
-                    self.logger.info(f"    Sample: {sample_conquer}")
-
-                def find_closest_file(target_dt: datetime, file_dict: dict, max_diff_seconds: int = 3600) -> Optional[str]:
-                    """Find the closest file to the target datetime within max_diff_seconds."""
-                    closest_key = None
-                    min_diff = float('inf')
-                    
-                    for timestamp_str, (file_dt, key) in file_dict.items():
-                        diff = abs((target_dt - file_dt).total_seconds())
-                        if diff < min_diff and diff <= max_diff_seconds:
-                            min_diff = diff
-                            closest_key = key
-                    
-                    return closest_key
+            manifest = None if full_rescan else self.load_snapshot_manifest()
 
-                # Create snapshots by starting with village files and finding matching files
-                processed_combinations = set()
-                
-                for village_timestamp, (village_dt, village_key) in sorted(village_files.items(), key=lambda x: x[1][0]):
-                    # Find closest matching files for this village timestamp
-                    player_key = find_closest_file(village_dt, player_files)
-                    ally_key = find_closest_file(village_dt, ally_files)
-                    conquer_key = "conquer.txt"
-                    killall_key = find_closest_file(village_dt, killall_files)
-                    killall_tribe_key = find_closest_file(village_dt, killall_tribe_files)
-                    killatt_key = find_closest_file(village_dt, killatt_files)
-                    killdef_key = find_closest_file(village_dt, killdef_files)
-                    killtribeatt_key = find_closest_file(village_dt, killtribeatt_files)
-                    killtribedef_key = find_closest_file(village_dt, killtribedef_files)
-
-                    # Create snapshot if we have the core files (village, player, ally)
-                    # Conquer files are optional
-                    if player_key and ally_key:
-                        # Create a unique combination identifier to avoid duplicates
-                        combination_id = (village_key, player_key, ally_key, conquer_key)
-                        
-                        if combination_id not in processed_combinations:
-                            processed_combinations.add(combination_id)
-                            
-                            village_data_path = f"s3://{self.s3_snapshot_bucket}/{village_key}"
-                            player_data_path = f"s3://{self.s3_snapshot_bucket}/{player_key}"
-                            tribe_data_path = f"s3://{self.s3_snapshot_bucket}/{ally_key}"
-                            conquer_data_path = f"s3://{self.s3_snapshot_bucket}/{self.server}{self.world}/conquer.txt" if conquer_key else None
-                            killall_data_path = f"s3://{self.s3_snapshot_bucket}/{killall_key}" if killall_key else None
-                            killall_tribe_data_path = f"s3://{self.s3_snapshot_bucket}/{killall_tribe_key}" if killall_tribe_key else None
-                            killatt_data_path = f"s3://{self.s3_snapshot_bucket}/{killatt_key}" if killatt_key else None
-                            killdef_data_path = f"s3://{self.s3_snapshot_bucket}/{killdef_key}" if killdef_key else None
-                            killtribeatt_data_path = f"s3://{self.s3_snapshot_bucket}/{killtribeatt_key}" if killtribeatt_key else None
-                            killtribedef_data_path = f"s3://{self.s3_snapshot_bucket}/{killtribedef_key}" if killtribedef_key else None
-
-                            try:
-                                # Use the village timestamp as the main timestamp for the snapshot
-                                snapshot = SnapshotFileModel(
-                                    world=self.world,
-                                    server=self.server,
-                                    timestamp=int(village_dt.replace(tzinfo=timezone.utc).timestamp()),
-                                    village_data_path=village_data_path,
-                                    player_data_path=player_data_path,
-                                    tribe_data_path=tribe_data_path,
-                                    conquer_data_path=conquer_data_path,
-                                    killall_data_path=killall_data_path,
-                                    killall_tribe_data_path=killall_tribe_data_path,
-                                    killatt_data_path=killatt_data_path,
-                                    killdef_data_path=killdef_data_path,
-                                    killtribeatt_data_path=killtribeatt_data_path,
-                                    killtribedef_data_path=killtribedef_data_path,
-                                )
-
-                                snapshot_files.append(snapshot)
-                                
-                                if not conquer_key:
-                                    self.logger.debug(f"Created snapshot for {village_timestamp} without conquer file")
-                            except Exception as e:
-                                self.logger.warning(f"Could not create snapshot for timestamp {village_timestamp}: {e}")
-                    else:
-                        missing_files = []
-                        if not player_key: missing_files.append("player")
-                        if not ally_key: missing_files.append("ally")
-                        self.logger.debug(f"Skipping village timestamp {village_timestamp}, missing required files: {', '.join(missing_files)}")
+            if manifest is None:
+                self.logger.info(f"Scanning S3 bucket '{self.s3_snapshot_bucket}' with prefix '{prefix}'")
+
+                # Get all files using pagination
+                keys = []
+                paginator = self.s3_client.get_paginator('list_objects_v2')
+                page_iterator = paginator.paginate(Bucket=self.s3_snapshot_bucket, Prefix=prefix)
+
+                for page in page_iterator:
+                    if 'Contents' in page:
+                        keys.extend(obj['Key'] for obj in page['Contents'])
+
+                self.logger.info(f"Found {len(keys)} total files in S3")
+                snapshot_files = self.match_snapshot_files(keys) if keys else []
             else:
+                new_keys = self.list_new_snapshot_keys(manifest.keys)
+                keys = sorted(manifest.keys + new_keys)
+                self.logger.info(f"Found {len(new_keys)} new files in S3 since the last scan ({len(keys)} total)")
+
+                new_timestamps = [ts for ts in (self.key_timestamp_str(key) for key in new_keys) if ts is not None]
+                if not new_keys:
+                    snapshot_files = list(manifest.snapshots)
+                elif len(new_timestamps) < len(new_keys):
+                    # A new file without a timestamp (e.g. conquer.txt) can change any snapshot
+                    snapshot_files = self.match_snapshot_files(keys)
+                else:
+                    # Snapshots more than MATCH_TOLERANCE_SECONDS before the oldest new file keep their matches,
+                    # the rest is rematched from the files that can still be matched to them.
+                    oldest_new = datetime.strptime(min(new_timestamps), "%Y%m%d_%H%M%S").replace(tzinfo=timezone.utc)
+                    cutoff = int(oldest_new.timestamp()) - self.MATCH_TOLERANCE_SECONDS
+                    window_start = (oldest_new - timedelta(seconds=2 * self.MATCH_TOLERANCE_SECONDS)).strftime("%Y%m%d_%H%M%S")
+
+                    kept = [snapshot for snapshot in manifest.snapshots if snapshot.timestamp < cutoff]
+                    window_keys = [key for key in keys if (self.key_timestamp_str(key) or window_start) >= window_start]
+                    rematched = [snapshot for snapshot in self.match_snapshot_files(window_keys) if snapshot.timestamp >= cutoff]
+                    snapshot_files = kept + rematched
+                    self.logger.info(f"Kept {len(kept)} snapshots from the manifest, rematched {len(rematched)}")
+
+            if not keys:
                 self.logger.warning(f"No files found in S3 bucket '{self.s3_snapshot_bucket}' with prefix '{prefix}'")
-            
+            elif manifest is None or new_keys:
+                self.save_snapshot_manifest(keys, snapshot_files)
+
             self.logger.info(f"Completed scanning snapshots for {self.server}{self.world}.")
-            self.logger.info(f"Found {len(files)} total files in S3")
             self.logger.info(f"Found {len(snapshot_files)} snapshots for {self.server}{self.world}.")
 
             self.snapshots = snapshot_files
@@ -312,6 +322,208 @@ class WorldLoader:
             self.logger.error(f"Error scanning snapshots for {self.server}{self.world}: {e}")
             return []
 
+    def match_snapshot_files(self, keys: List[str]) -> List[SnapshotFileModel]:
+        """Group snapshot file keys into snapshots, matching every village file with the closest other files.
+
+        Args:
+            keys (List[str]): Snapshot file keys of the world.
+
+        Returns:
+            List[SnapshotFileModel]: Snapshots sorted by timestamp.
+        """
+        snapshot_files = []
+
+        # Log the file prefixes we're looking for
+        self.logger.info(f"Looking for files with prefixes:")
+        self.logger.info(f"  Village: {self.village_file_prefix}")
+        self.logger.info(f"  Player: {self.player_file_prefix}")
+        self.logger.info(f"  Ally: {self.ally_file_prefix}")
+        self.logger.info(f"  Conquer: {self.conquer_file_prefix}")
+        
+        # Collect files by type with their timestamps and datetime objects
+        village_files = {}  # timestamp -> (datetime_obj, full_key)
+        player_files = {}
+        ally_files = {}
+        conquer_files = {}
+        killall_files = {}
+        killall_tribe_files = {}
+        killatt_files = {}
+        killdef_files = {}
+        killtribeatt_files = {}
+        killtribedef_files = {}
+        columnar_files = {}  # timestamp -> key, named after the village file timestamp
+
+        # Log first few files to see what we're working with
+        for i, key in enumerate(keys[:10]):
+            self.logger.info(f"Sample file {i+1}: {key}")
+        
+        # Track file types for analysis
+        other_files = []
+        
+        for key in keys:
+            try:
+                if key.startswith(self.columnar_file_prefix):
+                    timestamp_str = key[len(self.columnar_file_prefix):-4]
+                    columnar_files[timestamp_str] = key
+                elif key.startswith(self.village_file_prefix):
+                    timestamp_str = key[len(self.village_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    village_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.player_file_prefix):
+                    timestamp_str = key[len(self.player_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    player_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.ally_file_prefix):
+                    timestamp_str = key[len(self.ally_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    ally_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.conquer_file_prefix):
+                    # just grab conquer.txt
+                    conquer_files["conquer"] = (None, key)
+                elif key.startswith(self.killall_file_prefix):
+                    timestamp_str = key[len(self.killall_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    killall_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.killall_tribe_file_prefix):
+                    timestamp_str = key[len(self.killall_tribe_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    killall_tribe_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.killatt_file_prefix):
+                    timestamp_str = key[len(self.killatt_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    killatt_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.killdef_file_prefix):
+                    timestamp_str = key[len(self.killdef_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    killdef_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.killtribeatt_file_prefix):
+                    timestamp_str = key[len(self.killtribeatt_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    killtribeatt_files[timestamp_str] = (dt_obj, key)
+                elif key.startswith(self.killtribedef_file_prefix):
+                    timestamp_str = key[len(self.killtribedef_file_prefix):-4]
+                    dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
+                    killtribedef_files[timestamp_str] = (dt_obj, key)
+                else:
+                    other_files.append(key)
+            except Exception as e:
+                self.logger.warning(f"Could not parse filename {key}: {e}")
+                continue
+
+        self.logger.info(f"Found files by type:")
+        self.logger.info(f"  Village files: {len(village_files)}")
+        if village_files:
+            sample_village = list(village_files.values())[0][1]
+            self.logger.info(f"    Sample: {sample_village}")
+        self.logger.info(f"  Player files: {len(player_files)}")
+        if player_files:
+            sample_player = list(player_files.values())[0][1]
+            self.logger.info(f"    Sample: {sample_player}")
+        self.logger.info(f"  Ally files: {len(ally_files)}")
+        if ally_files:
+            sample_ally = list(ally_files.values())[0][1]
+            self.logger.info(f"    Sample: {sample_ally}")
+        self.logger.info(f"  Conquer files: {len(conquer_files)}")
+        if conquer_files:
+            sample_conquer = list(conquer_files.values())[0][1]
+            self.logger.info(f"    Sample: {sample_conquer}")
+
+        # Sorted timestamp indexes make every lookup a binary search instead of a scan of all files
+        file_indexes = {
+            "player": SnapshotFileIndex(player_files),
+            "ally": SnapshotFileIndex(ally_files),
+            "killall": SnapshotFileIndex(killall_files),
+            "killalltribe": SnapshotFileIndex(killall_tribe_files),
+            "killatt": SnapshotFileIndex(killatt_files),
+            "killdef": SnapshotFileIndex(killdef_files),
+            "killatttribe": SnapshotFileIndex(killtribeatt_files),
+            "killdeftribe": SnapshotFileIndex(killtribedef_files),
+        }
+
+        def find_closest_file(target_dt: datetime, file_type: str) -> Optional[str]:
+            """Find the closest file to the target datetime within MATCH_TOLERANCE_SECONDS."""
+            return file_indexes[file_type].closest(target_dt, self.MATCH_TOLERANCE_SECONDS)
+
+        # Create snapshots by starting with village files and finding matching files
+        processed_combinations = set()
+        
+        for village_timestamp, (village_dt, village_key) in sorted(village_files.items(), key=lambda x: x[1][0]):
+            # Find closest matching files for this village timestamp
+            player_key = find_closest_file(village_dt, "player")
+            ally_key = find_closest_file(village_dt, "ally")
+            conquer_key = "conquer.txt"
+            killall_key = find_closest_file(village_dt, "killall")
+            killall_tribe_key = find_closest_file(village_dt, "killalltribe")
+            killatt_key = find_closest_file(village_dt, "killatt")
+            killdef_key = find_closest_file(village_dt, "killdef")
+            killtribeatt_key = find_closest_file(village_dt, "killatttribe")
+            killtribedef_key = find_closest_file(village_dt, "killdeftribe")
+
+            # Create snapshot if we have the core files (village, player, ally)
+            # Conquer files are optional
+            if player_key and ally_key:
+                # Create a unique combination identifier to avoid duplicates
+                combination_id = (village_key, player_key, ally_key, conquer_key)
+                
+                if combination_id not in processed_combinations:
+                    processed_combinations.add(combination_id)
+                    
+                    village_data_path = f"s3://{self.s3_snapshot_bucket}/{village_key}"
+                    player_data_path = f"s3://{self.s3_snapshot_bucket}/{player_key}"
+                    tribe_data_path = f"s3://{self.s3_snapshot_bucket}/{ally_key}"
+                    conquer_data_path = f"s3://{self.s3_snapshot_bucket}/{self.server}{self.world}/conquer.txt" if conquer_key else None
+                    killall_data_path = f"s3://{self.s3_snapshot_bucket}/{killall_key}" if killall_key else None
+                    killall_tribe_data_path = f"s3://{self.s3_snapshot_bucket}/{killall_tribe_key}" if killall_tribe_key else None
+                    killatt_data_path = f"s3://{self.s3_snapshot_bucket}/{killatt_key}" if killatt_key else None
+                    killdef_data_path = f"s3://{self.s3_snapshot_bucket}/{killdef_key}" if killdef_key else None
+                    killtribeatt_data_path = f"s3://{self.s3_snapshot_bucket}/{killtribeatt_key}" if killtribeatt_key else None
+                    killtribedef_data_path = f"s3://{self.s3_snapshot_bucket}/{killtribedef_key}" if killtribedef_key else None
+                    columnar_key = columnar_files.get(village_timestamp)
+                    columnar_data_path = f"s3://{self.s3_snapshot_bucket}/{columnar_key}" if columnar_key else None
+
+                    try:
+                        # Use the village timestamp as the main timestamp for the snapshot
+                        snapshot = SnapshotFileModel(
+                            world=self.world,
+                            server=self.server,
+                            timestamp=int(village_dt.replace(tzinfo=timezone.utc).timestamp()),
+                            village_data_path=village_data_path,
+                            player_data_path=player_data_path,
+                            tribe_data_path=tribe_data_path,
+                            conquer_data_path=conquer_data_path,
+                            killall_data_path=killall_data_path,
+                            killall_tribe_data_path=killall_tribe_data_path,
+                            killatt_data_path=killatt_data_path,
+                            killdef_data_path=killdef_data_path,
+                            killtribeatt_data_path=killtribeatt_data_path,
+                            killtribedef_data_path=killtribedef_data_path,
+                            columnar_data_path=columnar_data_path,
+                        )
+
+                        snapshot_files.append(snapshot)
+                        
+                        if not conquer_key:
+                            self.logger.debug(f"Created snapshot for {village_timestamp} without conquer file")
+                    except Exception as e:
+                        self.logger.warning(f"Could not create snapshot for timestamp {village_timestamp}: {e}")
+            else:
+                missing_files = []
+                if not player_key: missing_files.append("player")
+                if not ally_key: missing_files.append("ally")
+                self.logger.debug(f"Skipping village timestamp {village_timestamp}, missing required files: {', '.join(missing_files)}")
+
+        # Report files that belong to no snapshot or could belong to several
+        self.match_report = {file_type: index.report() for file_type, index in file_indexes.items()}
+        for file_type, report in self.match_report.items():
+            if report["unmatched"]:
+                self.logger.warning(f"{len(report['unmatched'])} {file_type} files match no village file, e.g. {report['unmatched'][0]}")
+            if report["shared"]:
+                self.logger.warning(f"{len(report['shared'])} {file_type} files are matched to several village files, e.g. {report['shared'][0]}")
+            if report["ties"]:
+                self.logger.warning(f"{len(report['ties'])} village files are equally close to two {file_type} files, e.g. {report['ties'][0]}")
+
+        return snapshot_files
+
     def sync_timelapse_images(self) -> List[TimelapseImageModel]:
         """Sync the timelapse images for the world.
         
@@ -383,6 +595,7 @@ class WorldLoader:
                 killdef_data_path=snapshot.killdef_data_path,
                 killtribeatt_data_path=snapshot.killtribeatt_data_path,  
                 killtribedef_data_path=snapshot.killtribedef_data_path,
+                columnar_data_path=snapshot.columnar_data_path,
                 top_players_image_path=top_players_path if top_players_exists else None,
                 top_tribes_image_path=top_tribes_path if top_tribes_exists else None,
                 image_generated=top_players_exists and top_tribes_exists